@@ -1,11 +1,19 @@
-import os, openai
+import json, random, threading, config
+from concurrent.futures import Future, ThreadPoolExecutor
+from time import monotonic, perf_counter, sleep
 
 # from pydantic import BaseModel
-from dotenv import load_dotenv
+from metrics import metrics
 
 
-load_dotenv()
-api_key = os.getenv("openai_api_key")
+api_key = config.get("openai_api_key")
+base_url = config.get("openai_base_url", "https://api.openai.com/v1")  # Point it to a local stub for tests
+
+# The articles table is named after it, see `record.table_name`
+model = "gpt-4o-mini"  # less money per call
+
+# Bump whenever the prompt in `extract_data` changes so cached extractions are not reused
+prompt_version = 1
 
 
 # class ExtractorModel(BaseModel):
@@ -18,15 +26,39 @@ api_key = os.getenv("openai_api_key")
 
 class OpenAIExtractor:
     def __init__(self):
-        openai.api_key = api_key
-        self.model = "gpt-4o-mini"  # less money per call
-        self.valid_key = True if api_key is not None or api_key is not "MY_OPENAI_API_KEY" else False
+        self.model = model
+        self.valid_key = api_key not in (None, "", "MY_OPENAI_API_KEY")
         # self.model = "gpt-4o" # too expensive
         # self.model = "gpt-3.5-turbo",  # or gpt-4 if you have access to it
 
     def extract_data(self, summary: str, article_date: str) -> dict:
+        # Extract the content of the assistant's response
+        extracted_info = self.complete(summary, article_date)["choices"][0]["message"]["content"]
+        return extracted_info
+
+    def complete(self, summary: str, article_date: str):
+        """The whole Chat API response, including the token `usage`"""
+        # Imported on the first call, runs that never need GPT do not pay for it
+        import openai
+
+        openai.api_key = api_key
+        openai.api_base = base_url
+
         # Update the model and use the Chat API for the new version
-        response = openai.ChatCompletion.create(
+        with metrics.timer("gpt"):
+            return openai.ChatCompletion.create(**self.request_body(summary, article_date))
+
+    def batch_request(self, custom_id: str, summary: str, article_date: str) -> dict:
+        """One line of a Batch API input file, the body is the same as for `extract_data`"""
+        return {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": self.request_body(summary, article_date),
+        }
+
+    def request_body(self, summary: str, article_date: str) -> dict:
+        return dict(
             model=self.model,
             messages=[
                 {
@@ -64,9 +96,151 @@ class OpenAIExtractor:
             max_tokens=1000,
         )
 
-        # Extract the content of the assistant's response
-        extracted_info = response["choices"][0]["message"]["content"]
-        return extracted_info
+
+class TokenBucket:
+    """### Allows `per_minute` units per minute, refilled continuously"""
+
+    def __init__(self, per_minute: float):
+        self.capacity: float = per_minute
+        self.rate: float = per_minute / 60
+        self.available: float = per_minute
+        self.updated: float = monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount: float = 1):
+        """Blocks until `amount` units are available and takes them"""
+        amount = min(amount, self.capacity)
+
+        while True:
+            with self.lock:
+                now = monotonic()
+                self.available = min(
+                    self.capacity, self.available + (now - self.updated) * self.rate
+                )
+                self.updated = now
+
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+
+                wait = (amount - self.available) / self.rate
+
+            sleep(wait)
+
+
+class ExtractionPool:
+    """### Runs GPT extractions on worker threads with one shared extractor.
+    Calls stay within the requests and tokens per minute budgets, 429 and 5xx errors are retried with jitter"""
+
+    def __init__(
+        self,
+        extractor: OpenAIExtractor | None = None,
+        workers: int = 4,
+        requests_per_minute: float = 500,
+        tokens_per_minute: float = 200_000,
+        retries: int = 5,
+        backoff: float = 1.0,
+        backoff_cap: float = 60.0,
+    ):
+        import openai
+
+        self.extractor: OpenAIExtractor = extractor or OpenAIExtractor()
+
+        # Errors worth another try, any other API error fails the extraction right away
+        self.retry_errors: tuple = (
+            openai.error.RateLimitError,
+            openai.error.APIError,
+            openai.error.ServiceUnavailableError,
+            openai.error.Timeout,
+            openai.error.APIConnectionError,
+        )
+        self.api_error = openai.error.OpenAIError
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self.requests_bucket = TokenBucket(requests_per_minute)
+        self.tokens_bucket = TokenBucket(tokens_per_minute)
+        self.retries: int = retries
+        self.backoff: float = backoff
+        self.backoff_cap: float = backoff_cap
+
+        self.lock = threading.Lock()
+        self.stats: dict = {
+            "calls": 0,
+            "retries": 0,
+            "failures": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "latency": 0.0,
+        }
+
+    def estimate_tokens(self, summary: str, article_date: str) -> int:
+        """Rough upper bound the way the API counts it: prompt characters (Cyrillic is ~2 per token) plus `max_tokens`"""
+        body = self.extractor.request_body(summary, article_date)
+        characters = sum(len(message["content"]) for message in body["messages"])
+
+        return characters // 2 + body["max_tokens"]
+
+    def submit(self, summary: str, article_date: str) -> Future:
+        """Queues an extraction, the future resolves to the parsed GPT response"""
+        return self.executor.submit(self.extract, summary, article_date)
+
+    def extract(self, summary: str, article_date: str) -> dict:
+        tokens = self.estimate_tokens(summary, article_date)
+
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                with self.lock:
+                    self.stats["retries"] += 1
+                metrics.count("gpt_retries")
+                delay = min(self.backoff_cap, self.backoff * 2 ** (attempt - 1))
+                sleep(delay * random.uniform(0.5, 1.5))
+
+            self.requests_bucket.acquire()
+            self.tokens_bucket.acquire(tokens)
+
+            start = perf_counter()
+            try:
+                response = self.extractor.complete(summary, article_date)
+            except self.retry_errors as err:
+                print(f"[GPT] Retrying after error: {err}")
+                continue
+            except self.api_error:
+                with self.lock:
+                    self.stats["failures"] += 1
+                metrics.count("gpt_failures")
+                raise
+            latency = perf_counter() - start
+
+            usage = response.get("usage") or {}
+            with self.lock:
+                self.stats["calls"] += 1
+                self.stats["latency"] += latency
+                self.stats["prompt_tokens"] += usage.get("prompt_tokens", 0)
+                self.stats["completion_tokens"] += usage.get("completion_tokens", 0)
+            metrics.count("gpt_calls")
+            metrics.count("gpt_prompt_tokens", usage.get("prompt_tokens", 0))
+            metrics.count("gpt_completion_tokens", usage.get("completion_tokens", 0))
+            metrics.event("gpt_call", seconds=latency, tokens=usage.get("total_tokens", 0))
+            print(
+                f"[GPT] Extracted in {latency} seconds with {usage.get('total_tokens', 0)} tokens"
+            )
+
+            return json.loads(response["choices"][0]["message"]["content"])
+
+        with self.lock:
+            self.stats["failures"] += 1
+        metrics.count("gpt_failures")
+        raise RuntimeError(f"GPT extraction failed after {self.retries + 1} attempts")
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def print_stats(self):
+        calls = self.stats["calls"]
+        print(
+            f"[GPT] {calls} calls, {self.stats['retries']} retries, {self.stats['failures']} failures, "
+            f"{self.stats['prompt_tokens']} prompt / {self.stats['completion_tokens']} completion tokens, "
+            f"{self.stats['latency'] / max(1, calls)} seconds per call"
+        )
 
 
 if __name__ == "__main__":
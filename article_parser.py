@@ -0,0 +1,145 @@
+import re
+from bs4 import BeautifulSoup, SoupStrainer
+from notice_parser import parse_notice
+from gazetteer import canonical_location
+
+try:
+    import lxml  # noqa: F401
+
+    fast_parser: str = "lxml"
+except ImportError:
+    fast_parser: str = "html.parser"
+
+
+# RegEx for getting the town/village of the accident
+place_pattern = re.compile(
+    r"(гр\.|с\.|град |село |с . )\s?(.*?)(?= в |,| на | до | за | от |\W |$)"
+)
+period_pattern_check = re.compile(r"""(\d*:\d* - \d*:\d*)""")
+
+# (tag, class) -> field, the class can also be the full `class` attribute ("author vcard")
+article_fields: dict = {
+    ("div", "entry-summary"): "summary",
+    ("span", "ht-day"): "day",
+    ("span", "ht-month-year"): "month_year",
+    ("span", "author vcard"): "author",
+    ("h2", "entry-title"): "title",
+    ("div", "entry-categories"): "category",
+    ("i", "fa fa-comment-o"): "comment_icon",
+}
+
+# Only these subtrees are built when the listing page is parsed
+articles_strainer = SoupStrainer("article")
+nav_links_strainer = SoupStrainer(class_="nav-links")
+
+
+def parse_articles(content: bytes, parser: str = "html.parser") -> list:
+    """Parses only the `<article>` subtrees of a listing page"""
+    soup = BeautifulSoup(content, parser, parse_only=articles_strainer)
+
+    return soup.find_all("article")
+
+
+def parse_nav_links(content: bytes, parser: str = "html.parser"):
+    """Parses only the `.nav-links` subtree of a listing page"""
+    soup = BeautifulSoup(content, parser, parse_only=nav_links_strainer)
+
+    return soup.find(class_="nav-links")
+
+
+def extract_fields(article) -> dict:
+    """Walks the `<article>` once and collects the text of every known field, missing ones are "N/A" """
+    found: dict = {}
+    comments_link = None
+
+    for tag in article.find_all(True):
+        classes = tag.get("class")
+
+        if classes is None:
+            # First plain link is the comments one
+            if comments_link is None and tag.name == "a" and tag.get("href") is not None:
+                comments_link = tag
+            continue
+
+        for name in (" ".join(classes), *classes):
+            field = article_fields.get((tag.name, name))
+            if field is not None and field not in found:
+                found[field] = tag
+                break
+
+    categories = found.get("category")
+    category_link = categories.find("a") if categories is not None else None
+
+    def text(field: str) -> str:
+        return found[field].text.strip() if field in found else "N/A"
+
+    return {
+        "id": str(article.get("id", "N/A")),
+        "summary": text("summary"),
+        "day": text("day"),
+        "month_year": text("month_year"),
+        "author": text("author"),
+        "title": text("title"),
+        "category": category_link.text.strip() if category_link is not None else "N/A",
+        "comments": (
+            comments_link.text.strip()
+            if "comment_icon" in found and comments_link is not None
+            else "No Comments"
+        ),
+    }
+
+
+def format_place(summary: str) -> str | None:
+    """Town/village from the summary in the "гр. Name" / "с. Name" form"""
+    match = place_pattern.search(summary)
+    if match is None:
+        return None
+
+    return (
+        match.group(0)
+        .replace("гр. ", "гр.")
+        .replace("с. ", "с.")
+        .replace("гр.", "гр. ")
+        .replace("с.", "с. ")
+        .replace("град ", "гр. ")
+        .replace("село ", "с. ")
+    )
+
+
+def format_period(summary: str) -> str:
+    """Start and end hour from the summary as "HH:mm - HH:mm", "N/A" for the missing ones"""
+    start = (
+        summary.split("периода от ")[1].strip()[:5].replace(",", ":").replace(".", ":").strip()
+        if "периода от " in summary
+        else "N/A"
+    )
+    end = (
+        summary.split(" до ")[1].strip()[:5].replace(",", ":").replace(".", ":").strip()
+        if " до " in summary
+        else "N/A"
+    )
+
+    return f"{start} - {end}"
+
+
+def resolve_notice(summary: str, article_date: str) -> tuple[str | None, str, str]:
+    """Place and period of a summary and how they were found, the same way for scraped and stored articles.
+    "regex" when the RegEx results look complete, "rules" when the rule-based parser took over
+    and "gpt" when only GPT can tell, the RegEx values are returned for those.
+    Places come out in their gazetteer form"""
+    place = format_place(summary)
+    period = format_period(summary)  # Try and avoid using RegEx for extracting period
+
+    if (
+        "N/A" not in period
+        and period_pattern_check.search(period) is not None
+        and place is not None
+        and len(place.split()) <= 2
+    ):
+        return canonical_location([place]), period.strip(), "regex"
+
+    notice, resolved = parse_notice(summary, article_date)
+    if resolved:
+        return canonical_location(notice["places"]), notice["period"].strip(), "rules"
+
+    return canonical_location([place] if place else None), period.strip(), "gpt"
@@ -0,0 +1,62 @@
+"""Whole-file writes for the indexes, checkpoints, manifests and status files that other processes read"""
+
+import json, os, tempfile
+from contextlib import contextmanager
+
+
+def atomic_write(path: str, content: str | bytes, fsync: bool = True):
+    """Writes `content` to a uniquely named file next to `path` and swaps it in,
+    so a crash never leaves `path` half written and concurrent writers never share a temp file"""
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+
+    fd, temp_file = tempfile.mkstemp(
+        dir=os.path.dirname(path) or ".", prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_file, path)
+    except BaseException:
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_json(path: str, data, fsync: bool = True, **dump_options):
+    """`atomic_write` of `data` as JSON, `dump_options` go to `json.dumps`"""
+    atomic_write(path, json.dumps(data, **dump_options), fsync)
+
+
+@contextmanager
+def file_lock(path: str):
+    """Exclusive lock on `path` across processes, for read-modify-write of a file several workers share"""
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)  # Gives up after 10 seconds, so try again
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,216 @@
+"""Two-phase GPT extraction through the OpenAI Batch API.
+Phase 1 is `Scraper(gpt_mode="batch")`, which collects the articles that need GPT and `write_batch_file` saves them.
+Phase 2 is `python batch.py <batch file>`: submit, poll, ingest and update the DB"""
+
+import json, os, sys, requests
+from datetime import datetime
+from time import perf_counter, sleep
+from ai import OpenAIExtractor, api_key, base_url, prompt_version
+from atomic import atomic_write_json
+from cache import ExtractionCache
+from gazetteer import canonical_location
+from period import parse_period
+from places import place_rows
+from record import table_name
+
+
+finished_statuses = {"completed", "failed", "expired", "cancelled"}
+
+
+class BatchClient:
+    """### Minimal client for the OpenAI Files and Batches endpoints, `url` can point to a local stub server"""
+
+    def __init__(self, key: str | None = api_key, url: str = base_url, timeout: float = 60):
+        self.url: str = url.rstrip("/")
+        self.timeout: float = timeout
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {key}"
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        response = self.session.request(
+            method, f"{self.url}{path}", timeout=self.timeout, **kwargs
+        )
+        response.raise_for_status()
+
+        return response
+
+    def upload(self, path: str) -> str:
+        """Uploads a batch input file and returns its file id"""
+        with open(path, "rb") as f:
+            response = self.request(
+                "POST",
+                "/files",
+                data={"purpose": "batch"},
+                files={"file": (os.path.basename(path), f, "application/jsonl")},
+            )
+
+        return response.json()["id"]
+
+    def create(self, file_id: str) -> dict:
+        return self.request(
+            "POST",
+            "/batches",
+            json={
+                "input_file_id": file_id,
+                "endpoint": "/v1/chat/completions",
+                "completion_window": "24h",
+            },
+        ).json()
+
+    def retrieve(self, batch_id: str) -> dict:
+        return self.request("GET", f"/batches/{batch_id}").json()
+
+    def content(self, file_id: str) -> str:
+        return self.request("GET", f"/files/{file_id}/content").text
+
+    def wait(self, batch_id: str, interval: float = 30) -> dict:
+        """Polls the batch until it is finished one way or another"""
+        while True:
+            batch = self.retrieve(batch_id)
+            counts = batch.get("request_counts") or {}
+            print(
+                f"[Batch] {batch_id} is {batch['status']} ({counts.get('completed', 0)}/{counts.get('total', 0)})"
+            )
+
+            if batch["status"] in finished_statuses:
+                return batch
+
+            sleep(interval)
+
+
+def write_batch_file(pending: dict, path: str) -> int:
+    """Phase 1: writes `post_id -> (summary, article_date)` as Batch API requests with `custom_id=post_id`.
+    The summaries and dates are kept next to it in `<path>.meta.json` for the ingest"""
+    if not pending:
+        return 0
+
+    extractor = OpenAIExtractor()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, "w", encoding="utf-8") as f:
+        for post_id, (summary, article_date) in pending.items():
+            line = extractor.batch_request(post_id, summary, article_date)
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+    meta = {
+        "model": extractor.model,
+        "prompt_version": prompt_version,
+        "articles": {
+            post_id: {"summary": summary, "date": article_date}
+            for post_id, (summary, article_date) in pending.items()
+        },
+    }
+    with open(f"{path}.meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=4)
+
+    print(f"[Batch] Wrote {len(pending)} requests to {path}")
+
+    return len(pending)
+
+
+def ingest_results(text: str) -> dict:
+    """Parses a Batch API output file into `post_id -> GPT response`, failed lines are skipped"""
+    results = {}
+
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+
+        result = json.loads(line)
+        response = result.get("response") or {}
+
+        if result.get("error") or response.get("status_code") != 200:
+            print(f"[Batch] {result['custom_id']} failed: {result.get('error') or response}")
+            continue
+
+        try:
+            content = response["body"]["choices"][0]["message"]["content"]
+            results[result["custom_id"]] = json.loads(content)
+        except (KeyError, IndexError, json.JSONDecodeError) as err:
+            print(f"[Batch] {result['custom_id']} has an unreadable response: {err}")
+
+    return results
+
+
+def run_batch(path: str, client: BatchClient | None = None, interval: float = 30) -> dict:
+    """Phase 2: submits the batch file, waits for it and writes the extractions to the cache and DB"""
+    client = client or BatchClient()
+    start = perf_counter()
+
+    with open(f"{path}.meta.json", "r", encoding="utf-8") as f:
+        meta = json.load(f)
+
+    # A batch that was already submitted is only polled again
+    if not meta.get("batch_id"):
+        meta["batch_id"] = client.create(client.upload(path))["id"]
+        atomic_write_json(f"{path}.meta.json", meta, ensure_ascii=False, indent=4)
+        print(f"[Batch] Submitted {path} as {meta['batch_id']}")
+
+    batch = client.wait(meta["batch_id"], interval)
+    if batch["status"] != "completed" or not batch.get("output_file_id"):
+        print(f"[Batch] {meta['batch_id']} ended as {batch['status']}, nothing to ingest")
+
+        return {}
+
+    results = ingest_results(client.content(batch["output_file_id"]))
+
+    # Same responses as the synchronous path would have cached
+    gpt_cache = ExtractionCache(f"{os.path.dirname(__file__)}/logs/gpt/extractions.sqlite")
+    for post_id, response in results.items():
+        article = meta["articles"].get(post_id)
+        if article:
+            gpt_cache.put(
+                meta["model"], meta["prompt_version"], article["summary"], article["date"], response
+            )
+
+    article_dates = {
+        post_id: datetime.strptime(article["date"], "%d.%m.%Y").date()
+        for post_id, article in meta["articles"].items()
+    }
+    from db import Database
+
+    with Database() as db:
+        written = write_extractions(db, table_name(meta["model"]), results, article_dates)
+
+    print(
+        f"[Batch] Ingested {written} of {len(meta['articles'])} extractions in {perf_counter() - start} seconds"
+    )
+
+    return results
+
+
+def write_extractions(db, table: str, results: dict, article_dates: dict) -> int:
+    """Writes `post_id -> GPT response` over the stored place and period of the articles, together with their places.
+    `article_dates` are the `post_id -> date` of the articles, the periods are anchored on them"""
+    rows = [
+        (
+            canonical_location(response["places"]),
+            response["period"],
+            *(
+                parse_period(response["period"], article_dates[post_id])
+                if post_id in article_dates
+                else (None, None)
+            ),
+            post_id,
+        )
+        for post_id, response in results.items()
+    ]
+    places = [
+        place
+        for location, period, *_, post_id in rows
+        if post_id in article_dates
+        for place in place_rows(post_id, location, period, article_dates[post_id])
+    ]
+
+    written = db.update_extractions(table, rows)
+    db.replace_places(table, [post_id for *_, post_id in rows], places)
+
+    return written
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python batch.py <batch file>")
+        sys.exit(1)
+
+    run_batch(sys.argv[1])
@@ -0,0 +1,449 @@
+"""Benchmarks for the scraper, run with `python cli.py bench [--sizes 1,10,100] [--output results.json] [page.html ...]`.
+Without files the listing pages saved in the page cache (`logs/cache`) are used.
+The pipeline runs against a local HTTP server replaying those pages, an OpenAI stub and an SQLite stand-in for MySQL.
+Compare two result files with `python cli.py bench compare <old.json> <new.json>`"""
+
+import argparse, json, os, re, resource, sqlite3, subprocess, sys, tempfile, threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import get_context
+from time import perf_counter
+from bs4 import BeautifulSoup
+from cache import PageCache
+from article_parser import fast_parser, parse_articles, extract_fields, format_place
+
+
+logs_path: str = os.path.dirname(__file__)
+
+# The old per-field extraction, kept here to compare against
+legacy_place_pattern = r"(гр\.|с\.|град |село |с . )\s?(.*?)(?= в |,| на | до | за | от |\W |$)"
+
+
+def legacy_extract(article) -> dict:
+    return {
+        "id": str(article.get("id", "N/A")),
+        "summary": str(
+            article.find("div", class_="entry-summary").text.strip()
+            if article.find("div", class_="entry-summary")
+            else "N/A"
+        ),
+        "day": str(
+            article.find("span", class_="ht-day").text.strip()
+            if article.find("span", class_="ht-day")
+            else "N/A"
+        ),
+        "month_year": str(
+            article.find("span", class_="ht-month-year").text.strip()
+            if article.find("span", class_="ht-month-year")
+            else "N/A"
+        ),
+        "author": str(
+            article.find("span", class_="author vcard").text.strip()
+            if article.find("span", class_="author vcard")
+            else "N/A"
+        ),
+        "title": str(
+            article.find("h2", class_="entry-title").text.strip()
+            if article.find("h2", class_="entry-title")
+            else "N/A"
+        ),
+        "category": str(
+            article.find("div", class_="entry-categories").find("a").text.strip()
+            if article.find("div", class_="entry-categories")
+            else "N/A"
+        ),
+        "comments": str(
+            article.find("a", href=True, class_=None).text.strip()
+            if article.find("i", class_="fa fa-comment-o")
+            else "No Comments"
+        ),
+    }
+
+
+def legacy_place(summary: str) -> str | None:
+    return (
+        re.search(legacy_place_pattern, summary)
+        .group(0)[0:]
+        .replace("гр. ", "гр.")
+        .replace("с. ", "с.")
+        .replace("гр.", "гр. ")
+        .replace("с.", "с. ")
+        .replace("град ", "гр. ")
+        .replace("село ", "с. ")
+        if re.search(legacy_place_pattern, summary)
+        else None
+    )
+
+
+def load_pages(paths: list) -> list:
+    """Raw listing pages from the given files or from the page cache"""
+    if paths:
+        pages = []
+        for path in paths:
+            with open(path, "rb") as f:
+                pages.append(f.read())
+        return pages
+
+    cache = PageCache(f"{logs_path}/logs/cache", replay=True)
+    return [
+        cache.get(url)
+        for url in cache.index
+        if "/page/" in url and cache.get(url) is not None
+    ]
+
+
+def bench_parse(pages: list, rounds: int = 5) -> dict:
+    """Parse µs/article of the legacy path against the single-pass one with both tree builders"""
+    results = {}
+
+    def legacy(content):
+        for article in BeautifulSoup(content, "html.parser").find_all("article"):
+            fields = legacy_extract(article)
+            legacy_place(fields["summary"])
+
+    def single_pass(parser):
+        def run(content):
+            for article in parse_articles(content, parser):
+                fields = extract_fields(article)
+                format_place(fields["summary"])
+
+        return run
+
+    articles = sum(len(parse_articles(content)) for content in pages)
+
+    variants = {
+        "legacy": legacy,
+        "single_pass": single_pass("html.parser"),
+    }
+    if fast_parser != "html.parser":
+        variants[f"single_pass_{fast_parser}"] = single_pass(fast_parser)
+
+    for name, run in variants.items():
+        start = perf_counter()
+        for _ in range(rounds):
+            for content in pages:
+                run(content)
+        elapsed = perf_counter() - start
+
+        results[name] = {
+            "articles": articles * rounds,
+            "us_per_article": elapsed / max(1, articles * rounds) * 1_000_000,
+        }
+        print(f"[Bench] {name}: {results[name]['us_per_article']:.1f} µs/article")
+
+    # Both paths have to agree before the numbers mean anything
+    for content in pages:
+        old = [legacy_extract(a) for a in BeautifulSoup(content, "html.parser").find_all("article")]
+        new = [extract_fields(a) for a in parse_articles(content)]
+        if old != new:
+            print("[Bench] Warning: single-pass fields differ from the legacy ones")
+            break
+
+    return results
+
+
+class SqliteDatabase:
+    """### Stand-in for `db.Database` with the same writes on an SQLite file, times every write"""
+
+    def __init__(self, path: str, table: str):
+        from record import article_columns
+        from db import place_columns
+
+        self.article_columns: tuple = article_columns
+        self.place_columns: tuple = place_columns
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.write_seconds: float = 0
+        self.rows: int = 0
+
+        columns = ", ".join(article_columns)
+        self.connection.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS {table} ({columns}, date_updated, PRIMARY KEY (post_id));
+            CREATE TABLE IF NOT EXISTS {table}_edited ({columns}, UNIQUE (summary));
+            CREATE TABLE IF NOT EXISTS {table}_places ({", ".join(place_columns)}, PRIMARY KEY (post_id, place));
+            """
+        )
+
+    def close_connection(self):
+        self.connection.commit()
+
+    def execute_chunks(self, query: str, rows: list, chunk_size: int) -> int:
+        start = perf_counter()
+        for offset in range(0, len(rows), chunk_size):
+            self.connection.executemany(query, rows[offset : offset + chunk_size])
+            self.connection.commit()
+        self.write_seconds += perf_counter() - start
+
+        return len(rows)
+
+    def bulk_upsert(self, table: str, rows: list, chunk_size: int = 500) -> int:
+        columns = ", ".join(self.article_columns)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in self.article_columns[1:])
+        query = f"""
+            INSERT INTO {table} ({columns}, date_updated)
+            VALUES ({", ".join(["?"] * len(self.article_columns))}, datetime('now'))
+            ON CONFLICT (post_id) DO UPDATE SET {updates}, date_updated = datetime('now');
+        """
+
+        written = self.execute_chunks(query, [self.sqlite_row(row) for row in rows], chunk_size)
+        self.rows += written
+        return written
+
+    def move_data(self, keys: list, table: str, chunk_size: int = 500) -> int:
+        columns = ", ".join(self.article_columns)
+        for offset in range(0, len(keys), chunk_size):
+            chunk = keys[offset : offset + chunk_size]
+            self.connection.execute(
+                f"""
+                INSERT OR IGNORE INTO {table}_edited ({columns})
+                SELECT {columns} FROM {table} WHERE post_id IN ({", ".join(["?"] * len(chunk))});
+                """,
+                chunk,
+            )
+
+        return len(keys)
+
+    def replace_places(self, table: str, keys: list, rows: list, chunk_size: int = 500) -> int:
+        for offset in range(0, len(keys), chunk_size):
+            chunk = keys[offset : offset + chunk_size]
+            self.connection.execute(
+                f"DELETE FROM {table}_places WHERE post_id IN ({', '.join(['?'] * len(chunk))});",
+                chunk,
+            )
+
+        query = f"INSERT INTO {table}_places VALUES ({', '.join(['?'] * len(self.place_columns))});"
+        return self.execute_chunks(query, [self.sqlite_row(row) for row in rows], chunk_size)
+
+    @staticmethod
+    def sqlite_row(row: tuple) -> tuple:
+        # SQLite has no date types, store them as ISO text like MySQL shows them
+        return tuple(value.isoformat() if hasattr(value, "isoformat") else value for value in row)
+
+
+def fixture_handler(pages: list):
+    """Serves `/<year>/page/<n>/` from the saved pages in a loop.
+    Post IDs get the page number appended so every page is new to the scraper"""
+    id_pattern = re.compile(rb'id="(post-[^"]+)"')
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            match = re.search(r"/page/(\d+)", self.path)
+            if match is None:
+                self.send_error(404)
+                return
+
+            page = int(match.group(1))
+            body = id_pattern.sub(
+                lambda m: b'id="' + m.group(1) + f"-{page}".encode() + b'"',
+                pages[(page - 1) % len(pages)],
+            )
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=UTF-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+class OpenAIStubHandler(BaseHTTPRequestHandler):
+    """Answers every Chat API call with the same extraction"""
+
+    content: str = json.dumps(
+        {"places": ["гр. Пазарджик"], "period": "09:00 - 12:00", "street": "", "neighbourhood": "", "details": ""},
+        ensure_ascii=False,
+    )
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps(
+            {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion",
+                "model": "gpt-4o-mini",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": self.content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 500, "completion_tokens": 50, "total_tokens": 550},
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(handler) -> ThreadingHTTPServer:
+    """Starts `handler` on a free local port in a background thread"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_run(pages_url: str, size: int) -> dict:
+    """One scraper run over `size` pages in a fresh worker process, so the peak RSS is its own"""
+    from cache import ExtractionCache
+    from pipeline import Pipeline
+    from scraper import Scraper
+    from stream import JsonlWriter
+
+    with tempfile.TemporaryDirectory() as work_dir, open(os.devnull, "w") as devnull:
+        table = "vik_bench"
+        db = SqliteDatabase(f"{work_dir}/bench.sqlite", table)
+
+        with redirect_stdout(devnull):
+            start = perf_counter()
+            x = Scraper(
+                year=2024,
+                pages=size,
+                delay=0,
+                gpt_cache=ExtractionCache(f"{work_dir}/extractions.sqlite"),
+            )
+            x.url_articles = pages_url
+            x.fetcher.validators = {}
+            x.writer = JsonlWriter(work_dir)
+
+            pipeline = Pipeline(x, table, database=lambda: db)
+            pipeline.run()
+            elapsed = perf_counter() - start
+
+        db.connection.close()
+
+    stats = pipeline.stats
+    return {
+        "pages": stats["pages"],
+        "articles": stats["entries"],
+        "seconds": elapsed,
+        "pages_per_second": stats["pages"] / elapsed,
+        "articles_per_second": stats["entries"] / elapsed,
+        "db_rows": db.rows,
+        "db_rows_per_second": db.rows / max(db.write_seconds, 1e-9),
+        "gpt_calls": x.extract_stats["gpt"],
+        "bytes": x.fetcher.stats["bytes"],
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def bench_pipeline(pages: list, sizes: list) -> dict:
+    """Runs the whole pipeline for every page count against the local stand-ins"""
+    site = serve(fixture_handler(pages))
+    openai_stub = serve(OpenAIStubHandler)
+
+    # The workers read the OpenAI settings from the environment when they import `ai`
+    os.environ["openai_api_key"] = "bench"
+    os.environ["openai_base_url"] = f"http://127.0.0.1:{openai_stub.server_port}/v1"
+    pages_url = f"http://127.0.0.1:{site.server_port}/2024/page/"
+
+    results = {}
+    try:
+        for size in sizes:
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                result = executor.submit(bench_run, pages_url, size).result()
+
+            results[str(size)] = result
+            print(
+                f"[Bench] {size} pages: {result['pages_per_second']:.1f} pages/s, {result['articles_per_second']:.1f} articles/s, "
+                f"{result['db_rows_per_second']:.0f} DB rows/s, {result['peak_rss_mb']:.1f} MB peak RSS"
+            )
+    finally:
+        site.shutdown()
+        openai_stub.shutdown()
+
+    return results
+
+
+def bench_cold_start(rounds: int = 3) -> dict:
+    """Seconds from a new interpreter to the CLI help and to a loaded scraper, the fastest of `rounds`"""
+    commands = {
+        "cli_help": [sys.executable, os.path.join(logs_path, "cli.py"), "--help"],
+        "import_scraper": [sys.executable, "-c", "import scraper"],
+    }
+    results = {}
+
+    for name, command in commands.items():
+        times = []
+        for _ in range(rounds):
+            start = perf_counter()
+            subprocess.run(command, cwd=logs_path, capture_output=True, check=True)
+            times.append(perf_counter() - start)
+
+        results[name] = min(times)
+        print(f"[Bench] Cold start {name}: {results[name] * 1000:.0f} ms")
+
+    return results
+
+
+def commit_id() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=logs_path,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old: dict, new: dict):
+    """Prints the change of every pipeline number between two result files"""
+    print(f"[Bench] {old.get('commit')} -> {new.get('commit')}")
+    for size, result in new.get("pipeline", {}).items():
+        before = old.get("pipeline", {}).get(size)
+        if before is None:
+            continue
+
+        for key in ("pages_per_second", "articles_per_second", "db_rows_per_second", "peak_rss_mb"):
+            change = (result[key] - before[key]) / max(abs(before[key]), 1e-9)
+            print(f"[Bench] {size} pages {key}: {before[key]:.1f} -> {result[key]:.1f} ({change:+.1%})")
+
+    for name, seconds in new.get("cold_start", {}).items():
+        before = old.get("cold_start", {}).get(name)
+        if before is not None:
+            print(f"[Bench] Cold start {name}: {before * 1000:.0f} -> {seconds * 1000:.0f} ms ({(seconds - before) / before:+.1%})")
+
+
+def main(argv: list | None = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) == 3 and argv[0] == "compare":
+        with open(argv[1], "r", encoding="utf-8") as f_old, open(argv[2], "r", encoding="utf-8") as f_new:
+            compare(json.load(f_old), json.load(f_new))
+        return
+
+    parser = argparse.ArgumentParser(prog="cli.py bench", description="Scraper benchmarks")
+    parser.add_argument("files", nargs="*", help="Saved listing pages, the page cache by default")
+    parser.add_argument("--sizes", default="1,10,100", help="Page counts of the pipeline runs")
+    parser.add_argument("--rounds", type=int, default=5, help="Rounds of the parse benchmark")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    pages = load_pages(args.files)
+    if not pages:
+        print("[Bench] No saved pages, run a scrape with the page cache or pass HTML files")
+        sys.exit(1)
+
+    results = {
+        "commit": commit_id(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "fixtures": len(pages),
+        "cold_start": bench_cold_start(),
+        "parse": bench_parse(pages, args.rounds),
+        "pipeline": bench_pipeline(pages, [int(size) for size in args.sizes.split(",")]),
+    }
+
+    print(json.dumps(results, indent=4))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
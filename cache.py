@@ -0,0 +1,209 @@
+import hashlib, json, os, re, sqlite3, threading
+from time import time
+from atomic import atomic_write, atomic_write_json, file_lock
+from metrics import metrics
+
+
+class PageCache:
+    """### Content-addressed on-disk cache of raw page responses.
+    Bodies are stored once per SHA-256 under `objects/`, `index.json` maps every URL to its body.
+    Entries older than `ttl` seconds are stale, the least recently used ones are evicted above `max_bytes`.
+    With `replay` set the fetcher serves everything from here and never touches the network.
+    Export worker processes share one cache, every save merges the index on disk under a file lock"""
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float | None = 6 * 60 * 60,
+        max_bytes: int = 512 * 1024 * 1024,
+        replay: bool = False,
+    ):
+        self.path: str = path
+        self.objects_path: str = os.path.join(path, "objects")
+        self.index_file: str = os.path.join(path, "index.json")
+        self.lock_file: str = os.path.join(path, "index.lock")
+        self.ttl: float | None = ttl  # `None` never expires
+        self.max_bytes: int = max_bytes
+        self.replay: bool = replay
+
+        self.lock = threading.Lock()
+        self.stats: dict = {"hits": 0, "misses": 0, "stale": 0, "evicted": 0}
+
+        os.makedirs(self.objects_path, exist_ok=True)
+        self.index: dict = self.load_index()  # url -> {"hash", "size", "stored_at", "used_at"}
+        self.removed: set = set()  # URLs dropped since the last save, so the merge does not bring them back
+
+    def __getstate__(self) -> dict:
+        # Sent to export worker processes, every process gets its own lock
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def load_index(self) -> dict:
+        if os.path.exists(self.index_file):
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                try:
+                    return json.load(f)
+                except json.JSONDecodeError:
+                    return {}
+        return {}
+
+    def save_index(self):
+        """Merges what other processes saved in the meantime, the most recently used entry of a URL wins"""
+        with file_lock(self.lock_file):
+            for url, entry in self.load_index().items():
+                if url in self.removed:
+                    continue
+                current = self.index.get(url)
+                if current is None or entry["used_at"] > current["used_at"]:
+                    self.index[url] = entry
+
+            self.evict()
+            atomic_write_json(self.index_file, self.index, fsync=False)
+            self.removed = set()
+
+    def object_file(self, digest: str) -> str:
+        return os.path.join(self.objects_path, digest[:2], digest)
+
+    def get(self, url: str) -> bytes | None:
+        """Returns the cached body of `url`. Stale entries are only served in replay mode"""
+        with self.lock:
+            entry = self.index.get(url)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+
+            if (
+                not self.replay
+                and self.ttl is not None
+                and time() - entry["stored_at"] > self.ttl
+            ):
+                self.stats["stale"] += 1
+                return None
+
+            try:
+                with open(self.object_file(entry["hash"]), "rb") as f:
+                    content = f.read()
+            except FileNotFoundError:
+                del self.index[url]
+                self.removed.add(url)
+                self.stats["misses"] += 1
+                return None
+
+            entry["used_at"] = time()
+            self.stats["hits"] += 1
+
+            return content
+
+    def put(self, url: str, content: bytes):
+        digest = hashlib.sha256(content).hexdigest()
+        object_file = self.object_file(digest)
+
+        with self.lock:
+            if not os.path.exists(object_file):
+                os.makedirs(os.path.dirname(object_file), exist_ok=True)
+                atomic_write(object_file, content, fsync=False)
+
+            now = time()
+            self.index[url] = {
+                "hash": digest,
+                "size": len(content),
+                "stored_at": now,
+                "used_at": now,
+            }
+
+            self.removed.discard(url)
+            self.save_index()
+
+    def evict(self):
+        """Drops the least recently used URLs until the stored bodies fit in `max_bytes`"""
+        sizes = {entry["hash"]: entry["size"] for entry in self.index.values()}
+        total = sum(sizes.values())
+        if total <= self.max_bytes:
+            return
+
+        for url, entry in sorted(self.index.items(), key=lambda item: item[1]["used_at"]):
+            if total <= self.max_bytes:
+                break
+
+            del self.index[url]
+            self.removed.add(url)
+            self.stats["evicted"] += 1
+
+            # Bodies are shared between URLs with the same content
+            if any(other["hash"] == entry["hash"] for other in self.index.values()):
+                continue
+
+            total -= entry["size"]
+            try:
+                os.remove(self.object_file(entry["hash"]))
+            except FileNotFoundError:
+                pass
+
+    def print_stats(self):
+        print(
+            f"[Cache] {self.stats['hits']} hits, {self.stats['misses']} misses, {self.stats['stale']} stale, {self.stats['evicted']} evicted"
+        )
+
+
+class ExtractionCache:
+    """### Persistent SQLite cache of GPT extractions.
+    Keyed by model, prompt version, whitespace-normalized summary and article date, so the same notice is only sent once"""
+
+    def __init__(self, path: str):
+        self.path: str = path
+        self.lock = threading.Lock()
+        self.stats: dict = {"hits": 0, "misses": 0}
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Export worker processes share the file, so wait for each other's writes
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS extractions (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                prompt_version INTEGER NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def key(model: str, prompt_version: int, summary: str, article_date: str) -> str:
+        normalized = re.sub(r"\s+", " ", summary).strip()
+
+        return hashlib.sha256(
+            "\x1f".join((model, str(prompt_version), normalized, article_date.strip())).encode("utf-8")
+        ).hexdigest()
+
+    def get(self, model: str, prompt_version: int, summary: str, article_date: str) -> dict | None:
+        key = self.key(model, prompt_version, summary, article_date)
+
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT response FROM extractions WHERE key = ?", (key,)
+            ).fetchone()
+            self.stats["hits" if row else "misses"] += 1
+        metrics.count("gpt_cache_hits" if row else "gpt_cache_misses")
+
+        return json.loads(row[0]) if row else None
+
+    def put(self, model: str, prompt_version: int, summary: str, article_date: str, response: dict):
+        key = self.key(model, prompt_version, summary, article_date)
+
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO extractions VALUES (?, ?, ?, ?, ?)",
+                (key, model, prompt_version, json.dumps(response, ensure_ascii=False), time()),
+            )
+            self.connection.commit()
+
+    def print_stats(self):
+        print(f"[GPT Cache] {self.stats['hits']} hits, {self.stats['misses']} misses")
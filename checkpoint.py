@@ -0,0 +1,93 @@
+import json, os, threading
+from atomic import atomic_write_json
+
+
+class Checkpoint:
+    """### Progress of a long export, saved to a JSON file after every step so an interrupted run resumes where it stopped.
+    Keeps the last completed `(page, post_id)` per year, the finished years, the GPT work still waiting for the Batch API
+    and the synchronous extractions that failed. Both are saved with every page, a resumed run skips the entries
+    that are in the DB already and would not find them again"""
+
+    def __init__(self, path: str):
+        self.path: str = path
+        self.lock = threading.Lock()
+        self.state: dict = self.load()
+
+    def load(self) -> dict:
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                try:
+                    state = json.load(f)
+                    state.setdefault("gpt_failed", {})
+                    return state
+                except json.JSONDecodeError:
+                    print(f"[Checkpoint] {self.path} is broken, starting over")
+
+        return {"years": {}, "gpt_pending": {}, "gpt_failed": {}}
+
+    def save(self):
+        atomic_write_json(self.path, self.state, ensure_ascii=False, indent=4)
+
+    def year(self, year: int) -> dict:
+        return self.state["years"].setdefault(str(year), {"page": 0, "post_id": None, "done": False})
+
+    def year_done(self, year: int) -> bool:
+        return self.year(year)["done"]
+
+    def resume_page(self, year: int) -> int:
+        """Page to start from. The last completed page is scraped again because new posts shift the listing,
+        the entries that are already in the DB are skipped by the hash index"""
+        return max(1, self.year(year)["page"])
+
+    def page_done(
+        self, year: int, page: int, post_id: str | None, gpt_pending: dict | None = None, gpt_failed: dict | None = None
+    ):
+        with self.lock:
+            progress = self.year(year)
+            progress["page"] = page
+            progress["post_id"] = post_id
+            self.merge_gpt_work(gpt_pending, gpt_failed)
+            self.save()
+
+    def gpt_work(self, gpt_pending: dict | None, gpt_failed: dict | None):
+        """Saves the GPT work of a page that is done out of order, only when there is something new"""
+        with self.lock:
+            if self.merge_gpt_work(gpt_pending, gpt_failed):
+                self.save()
+
+    def merge_gpt_work(self, gpt_pending: dict | None, gpt_failed: dict | None) -> bool:
+        """`post_id -> (summary, date)` of both kinds into the state, returns whether anything was new"""
+        changed = False
+        for key, work in (("gpt_pending", gpt_pending), ("gpt_failed", gpt_failed)):
+            for post_id, (summary, article_date) in (work or {}).items():
+                if post_id not in self.state[key]:
+                    self.state[key][post_id] = [summary, article_date]
+                    changed = True
+
+        return changed
+
+    def year_finished(self, year: int, gpt_pending: dict, gpt_failed: dict | None = None):
+        """Marks the year as done together with the GPT work it left behind"""
+        with self.lock:
+            self.year(year)["done"] = True
+            self.merge_gpt_work(gpt_pending, gpt_failed)
+            self.save()
+
+    def gpt_pending(self) -> dict:
+        return {post_id: tuple(work) for post_id, work in self.state["gpt_pending"].items()}
+
+    def gpt_failed(self) -> dict:
+        return {post_id: tuple(work) for post_id, work in self.state["gpt_failed"].items()}
+
+    def gpt_retried(self, post_ids: list):
+        """Forgets the failed extractions that worked on another try"""
+        with self.lock:
+            for post_id in post_ids:
+                self.state["gpt_failed"].pop(post_id, None)
+            self.save()
+
+    def clear(self):
+        with self.lock:
+            self.state = {"years": {}, "gpt_pending": {}, "gpt_failed": {}}
+            if os.path.exists(self.path):
+                os.remove(self.path)
@@ -0,0 +1,136 @@
+"""Entry point of the scraper, `python cli.py <command> --help` shows the options of a command.
+Only argparse is loaded up front, every command imports what it needs once it runs"""
+
+import argparse, sys
+from datetime import datetime
+
+
+def parse_years(text: str | None) -> list | None:
+    """ "2021-2024" or "2021,2023" -> list of years, `None` for the current one"""
+    if not text:
+        return None
+
+    years = []
+    for part in text.split(","):
+        start, _, end = part.partition("-")
+        years.extend(range(int(start), int(end or start) + 1))
+
+    return years
+
+
+def incremental(args):
+    from scraper import incremental
+
+    incremental(args.year)
+
+
+def full_export(args):
+    from scraper import full_export, page_cache
+
+    cache = page_cache(replay=args.offline) if args.cache or args.offline else None
+    full_export(
+        years=parse_years(args.years),
+        cache=cache,
+        gpt_mode=args.gpt_mode,
+        resume=not args.restart,
+        processes=args.processes,
+    )
+
+
+def replay(args):
+    from scraper import replay
+
+    replay(parse_years(args.years), write_db=args.db)
+
+
+def reprocess(args):
+    from reprocess import reprocess_db, reprocess_files
+
+    options = {
+        "dry_run": args.dry_run,
+        "processes": args.processes,
+        "gpt_mode": args.gpt_mode,
+        "keep_gpt": args.keep_gpt,
+    }
+    if args.files:
+        reprocess_files(args.files, write_db=args.db, **options)
+    else:
+        reprocess_db(parse_years(args.years), **options)
+
+
+def daemon(args):
+    from daemon import Daemon
+
+    Daemon().run()
+
+
+def batch(args):
+    from batch import run_batch
+
+    run_batch(args.file)
+
+
+def bench(args):
+    from bench import main
+
+    main(args.extra)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cli.py", description="Outage notices scraper for vikpz.com")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("incremental", help="Scrape the new and changed entries into the DB")
+    command.add_argument("--year", type=int, default=datetime.now().year)
+    command.set_defaults(run=incremental)
+
+    command = commands.add_parser("full-export", help="Scrape whole years, resuming an interrupted export")
+    command.add_argument("--years", help='"2021-2024" or "2021,2023", the current year by default')
+    command.add_argument("--processes", type=int, default=1, help="Years exported in parallel")
+    command.add_argument("--gpt-mode", choices=("sync", "batch"), default="sync")
+    command.add_argument("--cache", action="store_true", help="Keep the downloaded pages in the page cache")
+    command.add_argument("--offline", action="store_true", help="Only use the pages in the page cache")
+    command.add_argument("--restart", action="store_true", help="Ignore the checkpoints of an earlier export")
+    command.set_defaults(run=full_export)
+
+    command = commands.add_parser("replay", help="Run the cached pages through the pipeline without the site")
+    command.add_argument("--years", help='"2021-2024" or "2021,2023", the current year by default')
+    command.add_argument("--db", action="store_true", help="Write to the DB and call GPT, JSON Lines only by default")
+    command.set_defaults(run=replay)
+
+    command = commands.add_parser("reprocess", help="Run the stored summaries through the current extractors")
+    command.add_argument("--years", help='"2021-2024" or "2021,2023", every year in the DB by default')
+    command.add_argument("--files", nargs="+", help="Read JSON Lines or older *_full.json dumps instead of the DB")
+    command.add_argument("--db", action="store_true", help="Also write the changes of --files to the DB")
+    command.add_argument("--processes", type=int, help="Worker processes, one per CPU by default")
+    command.add_argument("--gpt-mode", choices=("cache", "batch"), default="cache", help="batch also writes a Batch API file")
+    command.add_argument("--keep-gpt", action="store_true", help="Keep what GPT extracted even if the rules resolve it")
+    command.add_argument("--dry-run", action="store_true", help="Only print what would change")
+    command.set_defaults(run=reprocess)
+
+    command = commands.add_parser("daemon", help="Stay resident and poll the site")
+    command.set_defaults(run=daemon)
+
+    command = commands.add_parser("batch", help="Submit a Batch API file and ingest its results")
+    command.add_argument("file")
+    command.set_defaults(run=batch)
+
+    # Everything after "bench" goes to `bench.main`, including --help
+    command = commands.add_parser("bench", help="Run the benchmarks, the options are passed on", add_help=False)
+    command.set_defaults(run=bench)
+
+    return parser
+
+
+def main(argv: list | None = None):
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if extra and args.command != "bench":
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+
+    args.extra = extra
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
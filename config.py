@@ -0,0 +1,33 @@
+"""Settings of the scraper from the environment, `.env` next to this file is read once on the first lookup.
+Variables that are already set in the environment win over the file"""
+
+import os
+
+
+env_file: str = os.path.join(os.path.dirname(__file__), ".env")
+loaded: bool = False
+
+
+def load():
+    global loaded
+    if loaded:
+        return
+
+    from dotenv import load_dotenv
+
+    load_dotenv(env_file)
+    loaded = True
+
+
+def get(name: str, default: str | None = None) -> str | None:
+    load()
+    return os.getenv(name, default)
+
+
+def path(name: str, default: str | None = None) -> str | None:
+    """A file setting, relative paths are taken from this folder and not from where the scraper was started"""
+    value = get(name, default)
+    if value and not os.path.isabs(value):
+        value = os.path.join(os.path.dirname(__file__), value)
+
+    return value
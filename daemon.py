@@ -0,0 +1,212 @@
+"""Resident incremental scraper, run with `python daemon.py` instead of a cron job.
+Keeps the HTTP session, the DB pool, the GPT cache and the index of the year in memory between polls.
+Polls often in working hours and backs off while nothing changes, SIGTERM/SIGINT finish the current poll and exit.
+`python daemon.py status` prints the status file and exits with 1 when the daemon looks stuck"""
+
+import json, os, signal, sys, threading
+from datetime import datetime, timedelta
+from time import perf_counter
+from atomic import atomic_write_json
+
+
+logs_path: str = os.path.dirname(__file__)
+status_file: str = f"{logs_path}/logs/daemon_status.json"
+
+# Notices are posted on weekdays during office hours
+work_days: tuple = (0, 1, 2, 3, 4)
+work_hours: tuple = (7, 19)
+
+
+class Daemon:
+    """### Polls the listing of the current year on an adaptive interval and streams new entries into the DB.
+    The interval starts at `work_interval` in working hours and `off_interval` outside of them,
+    every poll without new entries doubles it up to the matching maximum and a poll with new entries or the start of the working hours resets it"""
+
+    def __init__(
+        self,
+        work_interval: float = 60,
+        max_work_interval: float = 10 * 60,
+        off_interval: float = 10 * 60,
+        max_off_interval: float = 60 * 60,
+        status_path: str = status_file,
+    ):
+        self.work_interval: float = work_interval
+        self.max_work_interval: float = max_work_interval
+        self.off_interval: float = off_interval
+        self.max_off_interval: float = max_off_interval
+        self.status_path: str = status_path
+
+        self.stopping = threading.Event()
+        self.scraper = None
+        self.pipeline = None
+        self.table: str | None = None
+        self.quiet_polls: int = 0  # Polls in a row without new entries
+        self.work_hours: bool | None = None  # Whether the last interval was one of the working hours
+
+        self.status: dict = {
+            "pid": os.getpid(),
+            "state": "starting",
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "polls": 0,
+            "failed_polls": 0,
+            "new_entries": 0,
+            "last_new_entries": 0,
+            "last_poll_complete": None,
+            "last_poll_at": None,
+            "last_success_at": None,
+            "last_error": None,
+            "interval": None,
+            "next_poll_at": None,
+        }
+
+    def write_status(self, **changes):
+        self.status.update(changes)
+        atomic_write_json(self.status_path, self.status, fsync=False, ensure_ascii=False, indent=4)
+
+    def stop(self, *args):
+        """Signal handler, the poll in progress commits what it already has and the loop exits"""
+        print("[Daemon] Stopping after the current poll")
+        self.stopping.set()
+        if self.pipeline is not None:
+            self.pipeline.stop.set()
+
+    def in_work_hours(self, now: datetime) -> bool:
+        return now.weekday() in work_days and work_hours[0] <= now.hour < work_hours[1]
+
+    def interval(self, now: datetime) -> float:
+        work_hours = self.in_work_hours(now)
+        # The quiet night must not back off the first polls of the day
+        if work_hours and self.work_hours is False:
+            self.quiet_polls = 0
+        self.work_hours = work_hours
+
+        if work_hours:
+            base, cap = self.work_interval, self.max_work_interval
+        else:
+            base, cap = self.off_interval, self.max_off_interval
+
+        return min(cap, base * 2 ** min(self.quiet_polls, 16))
+
+    def warm_up(self, year: int):
+        """Builds the scraper of `year` with the index from the DB, again when the year changes"""
+        from ai import model
+        from db import Database
+        from record import table_name
+        from scraper import Scraper, year_manifest
+
+        self.table = table_name(model)
+        with Database() as db:
+            existing_data = db.get_index(self.table, year)
+
+        if existing_data is False:
+            raise RuntimeError(f"Could not load the index of {year}")
+
+        print(f"[Daemon] {len(existing_data)} entries of {year} loaded")
+        self.scraper = Scraper(
+            year=year, pages=1, existing_data=existing_data, manifest=year_manifest(year)
+        )
+
+    def poll(self) -> int:
+        """One incremental run, returns the number of entries written"""
+        from pipeline import Pipeline
+
+        year = datetime.now().year
+        if self.scraper is None or self.scraper.year != year:
+            self.warm_up(year)
+
+        self.scraper.new_run()
+        if self.scraper.total_pages <= 0:
+            raise RuntimeError("Got no pages")
+
+        pipeline = self.pipeline = Pipeline(self.scraper, self.table)
+        try:
+            written = pipeline.run()
+        finally:
+            self.pipeline = None
+
+            # A stopped or failed poll left pages unparsed, their validators would turn them into 304s.
+            # The manifest keeps them owed so the next poll goes through them
+            self.status["last_poll_complete"] = pipeline.completed
+            if pipeline.completed:
+                self.scraper.fetcher.save_validators()
+            else:
+                self.scraper.fetcher.discard_validators()
+                print("[Daemon] The poll did not finish, the next one picks up its pages")
+
+        return written
+
+    def run(self):
+        from metrics import metrics
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        metrics.serve()
+        print(f"[Daemon] Started with pid {os.getpid()}, status in {self.status_path}")
+
+        while not self.stopping.is_set():
+            poll_start = perf_counter()
+            self.write_status(state="polling", last_poll_at=datetime.now().isoformat(timespec="seconds"))
+
+            try:
+                written = self.poll()
+                self.quiet_polls = 0 if written else self.quiet_polls + 1
+                self.write_status(
+                    polls=self.status["polls"] + 1,
+                    new_entries=self.status["new_entries"] + written,
+                    last_new_entries=written,
+                    last_success_at=datetime.now().isoformat(timespec="seconds"),
+                    last_error=None,
+                )
+            except Exception as err:
+                print(f"[Daemon] Poll failed: {err}")
+                self.quiet_polls += 1
+                self.write_status(
+                    polls=self.status["polls"] + 1,
+                    failed_polls=self.status["failed_polls"] + 1,
+                    last_error=str(err),
+                )
+
+            metrics.flush("poll", seconds=perf_counter() - poll_start, written=self.status["last_new_entries"])
+
+            now = datetime.now()
+            interval = self.interval(now)
+            self.write_status(
+                state="sleeping",
+                interval=interval,
+                next_poll_at=(now + timedelta(seconds=interval)).isoformat(timespec="seconds"),
+            )
+            print(f"[Daemon] Next poll in {interval:.0f} seconds")
+            self.stopping.wait(interval)
+
+        self.write_status(state="stopped", next_poll_at=None)
+        print("[Daemon] Stopped")
+
+
+def healthy(status: dict, now: datetime | None = None) -> bool:
+    """Running and polled within twice its interval, a daemon that is polling right now gets an hour"""
+    if status.get("state") == "stopped":
+        return False
+
+    now = now or datetime.now()
+    if status.get("state") == "polling":
+        return now - datetime.fromisoformat(status["last_poll_at"]) < timedelta(hours=1)
+
+    next_poll_at = status.get("next_poll_at")
+    if next_poll_at is None:
+        return False
+
+    return now < datetime.fromisoformat(next_poll_at) + timedelta(seconds=status["interval"])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "status":
+        if not os.path.exists(status_file):
+            print(f"[Daemon] No status file at {status_file}")
+            sys.exit(1)
+
+        with open(status_file, "r", encoding="utf-8") as f:
+            status = json.load(f)
+        print(json.dumps(status, ensure_ascii=False, indent=4))
+        sys.exit(0 if healthy(status) else 1)
+
+    Daemon().run()
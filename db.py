@@ -1,35 +1,86 @@
-import os
+import os, threading, config
+from datetime import date, datetime, timedelta
 import mysql.connector
 from mysql.connector.cursor import MySQLCursorDict
-from dotenv import load_dotenv
+from mysql.connector.pooling import MySQLConnectionPool
+from record import Article, article_columns
+from gazetteer import place_id
+from metrics import metrics
 
 
-load_dotenv()
-host = os.getenv("host")
-user = os.getenv("user")
-password = os.getenv("password")
-database = os.getenv("database")
+host = config.get("host")
+user = config.get("user")
+password = config.get("password")
+database = config.get("database")
+pool_size = int(config.get("db_pool_size", "5"))
+
+# One pool per process, created on the first `Database()`
+pool: MySQLConnectionPool | None = None
+pool_pid: int | None = None
+pool_lock = threading.Lock()
+
+# Column order of the places tables, one row per town or village of an article
+place_columns: tuple = ("post_id", "place", "place_id", "article_date", "period_start", "period_end")
+
+
+def get_pool() -> MySQLConnectionPool:
+    """The connection pool of this process, a forked worker gets its own instead of the parent's sockets"""
+    global pool, pool_pid
+
+    with pool_lock:
+        if pool is None or pool_pid != os.getpid():
+            pool = MySQLConnectionPool(
+                pool_name=f"vik_scraper_{os.getpid()}",
+                pool_size=pool_size,
+                pool_reset_session=True,
+                host=host,
+                user=user,
+                password=password,
+                database=database,
+                auth_plugin="mysql_native_password",
+            )
+            pool_pid = os.getpid()
+            print(f"[DB] Created a pool of {pool_size} connections to '{database}' with user '{user}'")
+
+        return pool
 
 
 class Database:
-    """### Connects to the database with credentials from `.env`"""
+    """### Checks out a pooled connection to the database with credentials from `.env`.
+    Use it as `with Database() as db:` or call `close_connection` to give the connection back"""
 
     def __init__(self):
-        self.connection = mysql.connector.connect(
-            host=host,
-            user=user,
-            password=password,
-            database=database,
-            auth_plugin="mysql_native_password",
-        )
+        self.connection = get_pool().get_connection()
+        self.ensure_connected()
+        self.cursor = self.connection.cursor(cursor_class=MySQLCursorDict)
+        self.prepared_cursor = None  # Server-side prepared statements, opened on first use
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close_connection()
+
+    def ensure_connected(self):
+        """Health check before use, a connection the server dropped while pooled is reconnected"""
+        self.connection.ping(reconnect=True, attempts=3, delay=1)
+
+    def reconnect(self):
+        self.ensure_connected()
         self.cursor = self.connection.cursor(cursor_class=MySQLCursorDict)
-        print(f"[DB] Successfully connected to '{database}' with user '{user}'")
+        self.prepared_cursor = None
+        print("[DB] Reconnected")
 
     def close_connection(self):
-        if self.connection.is_connected():
+        """Gives the connection back to the pool"""
+        try:
             self.cursor.close()
-            self.connection.close()
-            print("[DB] Connection closed")
+            if self.prepared_cursor is not None:
+                self.prepared_cursor.close()
+        except mysql.connector.Error:
+            pass
+
+        self.connection.close()
 
     def execute_query(self, query: str) -> bool:
         """### Executes any query passed to it"""
@@ -53,19 +104,7 @@ class Database:
 
             if data:
                 for item in data:
-                    return_data[item["post_id"]] = {
-                        "date": item["article_date"],
-                        "place": item["location"],
-                        "period": item["period"],
-                        "author": item["author"],
-                        "title": item["title"],
-                        "category": item["category"],
-                        "summary": item["summary"],
-                        "current_page": item["page"],
-                        "total_pages": item["total_pages"],
-                        "comments": item["comments"],
-                        "ai_extract": item["ai_extract"],
-                    }
+                    return_data[item["post_id"]] = Article.from_row(item)
 
                 print(f"[DB] Got {len(return_data)} items from DB. Query:\n{query}")
                 return return_data
@@ -76,23 +115,314 @@ class Database:
 
             return False
 
-    def move_data(self, key: str, post: dict, table: str) -> bool:
-        """### Moves an existing `post_id` to the edited table"""
+    def get_index(self, table: str, year: int, batch_size: int = 1000) -> dict | bool:
+        """### Gets `post_id -> (summary hash, date_updated)` for the articles of `year`.
+        Only the narrow columns are selected and the rows are streamed in batches"""
+        query = f"""
+            SELECT `post_id`, SHA1(`summary`), `date_updated` FROM {table}
+            WHERE `article_date` >= %s AND `article_date` < %s;
+        """
+
+        # Plain unbuffered cursor, rows are read from the server as we go instead of all at once
+        cursor = self.connection.cursor(buffered=False)
+        try:
+            return_data = {}
+            cursor.execute(query, (f"{year}-01-01", f"{year + 1}-01-01"))
+
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+
+                for post_id, digest, date_updated in rows:
+                    return_data[post_id] = (digest, date_updated)
+
+            print(f"[DB] Got {len(return_data)} hashes for {year} from {table}")
+            return return_data
+        except mysql.connector.Error as err:
+            print(f"[DB] Error: {err}")
+
+            return False
+        finally:
+            cursor.close()
+
+    def bulk_upsert(self, table: str, rows: list, chunk_size: int = 500) -> int:
+        """### Inserts or updates `rows` (`Article.to_row` tuples) in chunks, one transaction per chunk.
+        Returns the number of rows written"""
+        columns = ", ".join(f"`{column}`" for column in article_columns)
+        placeholders = ", ".join(["%s"] * len(article_columns))
+        updates = ", ".join(
+            f"`{column}` = VALUES(`{column}`)" for column in article_columns[1:]
+        )
+        query = f"""
+            INSERT INTO {table} ({columns})
+            VALUES ({placeholders})
+            ON DUPLICATE KEY UPDATE {updates}, `date_updated` = NOW();
+        """
+
+        return self.execute_chunks(query, rows, chunk_size)
+
+    def update_extractions(
+        self, table: str, rows: list, chunk_size: int = 500, ai_extract: bool = True
+    ) -> int:
+        """### Sets the extracted `(location, period, period_start, period_end, post_id)` rows in chunks.
+        `ai_extract` tells if GPT or the RegEx and rules found them. Returns the number of rows written.
+        One row per statement, so it runs as a server-side prepared statement"""
+        query = f"""
+            UPDATE {table}
+            SET `location` = %s, `period` = %s, `period_start` = %s, `period_end` = %s,
+                `ai_extract` = {int(ai_extract)}, `date_updated` = NOW()
+            WHERE `post_id` = %s
+        """
+
+        return self.execute_chunks(query, rows, chunk_size, prepared=True)
+
+    def update_periods(self, table: str, rows: list, chunk_size: int = 500) -> int:
+        """### Sets the parsed `(period_start, period_end, post_id)` rows in chunks. Returns the number of rows written"""
+        query = f"""
+            UPDATE {table}
+            SET `period_start` = %s, `period_end` = %s
+            WHERE `post_id` = %s
+        """
+
+        return self.execute_chunks(query, rows, chunk_size, prepared=True)
+
+    def move_data(self, keys: list, table: str, chunk_size: int = 500) -> int:
+        """### Copies the current rows of `keys` from `table` to its edited table before they get updated.
+        Every move is a new version stamped with `date_archived`. Returns the number of rows archived"""
+        columns = ", ".join(f"`{column}`" for column in article_columns)
+        moved = 0
+
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start : start + chunk_size]
+            query = f"""
+                INSERT IGNORE INTO {table}_edited ({columns})
+                SELECT {columns} FROM {table}
+                WHERE `post_id` IN ({", ".join(["%s"] * len(chunk))});
+            """
+
+            try:
+                self.cursor.execute(query, chunk)
+                self.connection.commit()
+                moved += self.cursor.rowcount
+            except mysql.connector.Error as err:
+                self.connection.rollback()
+                print(f"[DB] Error: {err}")
+
+        return moved
+
+    def replace_places(self, table: str, keys: list, rows: list, chunk_size: int = 500) -> int:
+        """### Replaces the places of `keys` with `rows` (`place_columns` tuples), one transaction per chunk of keys.
+        Returns the number of places written"""
+        columns = ", ".join(f"`{column}`" for column in place_columns)
+        insert_query = f"""
+            INSERT INTO {table}_places ({columns})
+            VALUES ({", ".join(["%s"] * len(place_columns))});
+        """
+        written = 0
+
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start : start + chunk_size]
+            chunk_keys = set(chunk)
+            chunk_rows = [row for row in rows if row[0] in chunk_keys]
+            delete_query = f"""
+                DELETE FROM {table}_places
+                WHERE `post_id` IN ({", ".join(["%s"] * len(chunk))});
+            """
+
+            try:
+                with metrics.timer("db_commit"):
+                    self.cursor.execute(delete_query, chunk)
+                    if chunk_rows:
+                        self.cursor.executemany(insert_query, chunk_rows)
+                    self.connection.commit()
+                written += len(chunk_rows)
+                metrics.count("db_places_written", len(chunk_rows))
+            except mysql.connector.Error as err:
+                self.connection.rollback()
+                metrics.count("db_errors")
+                print(f"[DB] Error: {err}\n[DB] Could NOT write the places of {len(chunk)} entries")
+
+        return written
 
+    def outages_between(self, table: str, start: date, end: date) -> list | bool:
+        """### Gets the articles dated from `start` to `end` inclusive, newest first. Seeks on the `article_date` index"""
         query = f"""
-            INSERT IGNORE INTO vik_{table.replace("-", "_")}_edited (`post_id`, `title`, `location`, `period`, `author`, `summary`, `category`, `ai_extract`, `page`, `total_pages`, `comments`, `article_date` ) 
-            VALUES 
-            ('{key}', '{post["title"]}', '{post["place"]}', '{post["period"]}', '{post["author"]}', '{post["summary"]}', '{post["category"]}', '{post["ai_extract"]}', 
-            '{post["current_page"]}', '{post["total_pages"]}', '{post["comments"]}', '{post["date"]}');
+            SELECT * FROM {table}
+            WHERE `article_date` BETWEEN %s AND %s
+            ORDER BY `article_date` DESC;
         """
 
         try:
-            self.cursor.execute(query)
-            self.connection.commit()
-            # print("[DB] Query executed successfully")
+            self.cursor.execute(query, (start, end))
+            return self.cursor.fetchall()
+        except mysql.connector.Error as err:
+            print(f"[DB] Error: {err}")
 
-            return True
+            return False
+
+    def outages_now(self, table: str, now: datetime | None = None, open_hours: int = 12) -> list | bool:
+        """### Gets the articles whose outage is going on at `now`, the current time by default, latest end first.
+        Outages with an end are a range scan on `period_end`, the ones with only a start count
+        for `open_hours` after it and are a range scan on `period_start`"""
+        now = now or datetime.now()
+        query = f"""
+            (SELECT * FROM {table}
+            WHERE `period_end` > %s AND (`period_start` IS NULL OR `period_start` <= %s))
+            UNION ALL
+            (SELECT * FROM {table}
+            WHERE `period_start` BETWEEN %s AND %s AND `period_end` IS NULL)
+            ORDER BY `period_end` IS NULL, `period_end` DESC;
+        """
+
+        try:
+            self.cursor.execute(query, (now, now, now - timedelta(hours=open_hours), now))
+            return self.cursor.fetchall()
         except mysql.connector.Error as err:
             print(f"[DB] Error: {err}")
 
             return False
+
+    def outages_in_place(
+        self, table: str, place: str, start: date | None = None, end: date | None = None
+    ) -> list | bool:
+        """### Gets the articles about `place` ("с. Мало Конаре"), optionally dated from `start` to `end`, newest first.
+        Places in the gazetteer are found by their ID whatever way they were written, the others by name.
+        Every row also has the parsed `period_start` and `period_end` of the outage"""
+        settlement_id = place_id(place)
+        if settlement_id is not None:
+            conditions = ["p.`place_id` = %s"]
+            params: list = [settlement_id]
+        else:
+            conditions = ["p.`place` = %s"]
+            params = [place]
+        if start is not None:
+            conditions.append("p.`article_date` >= %s")
+            params.append(start)
+        if end is not None:
+            conditions.append("p.`article_date` <= %s")
+            params.append(end)
+
+        query = f"""
+            SELECT a.*, p.`period_start`, p.`period_end` FROM {table}_places p
+            JOIN {table} a ON a.`post_id` = p.`post_id`
+            WHERE {" AND ".join(conditions)}
+            ORDER BY p.`article_date` DESC;
+        """
+
+        try:
+            self.cursor.execute(query, params)
+            return self.cursor.fetchall()
+        except mysql.connector.Error as err:
+            print(f"[DB] Error: {err}")
+
+            return False
+
+    def outages_per_place(
+        self, table: str, start: date, end: date, settlements: str = "vik_settlements"
+    ) -> list | bool:
+        """### Gets the number of outages of every settlement dated from `start` to `end` inclusive, most first.
+        Joins on the `place_id` index, places outside the gazetteer are not counted"""
+        query = f"""
+            SELECT s.`id`, s.`kind`, s.`name`, s.`municipality`, COUNT(*) AS `outages` FROM {table}_places p
+            JOIN {settlements} s ON s.`id` = p.`place_id`
+            WHERE p.`article_date` BETWEEN %s AND %s
+            GROUP BY s.`id`
+            ORDER BY `outages` DESC;
+        """
+
+        try:
+            self.cursor.execute(query, (start, end))
+            return self.cursor.fetchall()
+        except mysql.connector.Error as err:
+            print(f"[DB] Error: {err}")
+
+            return False
+
+    def upsert_settlements(self, table: str, settlements: list, chunk_size: int = 500) -> int:
+        """### Inserts or updates the `gazetteer.Settlement`s. Returns the number of rows written"""
+        query = f"""
+            INSERT INTO {table} (`id`, `kind`, `name`, `municipality`)
+            VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE `kind` = VALUES(`kind`), `name` = VALUES(`name`), `municipality` = VALUES(`municipality`);
+        """
+        rows = [(item.id, item.kind, item.name, item.municipality) for item in settlements]
+
+        return self.execute_chunks(query, rows, chunk_size)
+
+    def get_locations(self, table: str, batch_size: int = 1000):
+        """### Yields `(post_id, location, period, article_date)` of every article, streamed in batches"""
+        cursor = self.connection.cursor(buffered=False)
+        try:
+            cursor.execute(f"SELECT `post_id`, `location`, `period`, `article_date` FROM {table};")
+            while rows := cursor.fetchmany(batch_size):
+                yield from rows
+        finally:
+            cursor.close()
+
+    def get_years(self, table: str) -> list:
+        """### The years that have articles in `table`, oldest first"""
+        self.cursor.execute(
+            f"SELECT DISTINCT YEAR(`article_date`) AS `year` FROM {table} WHERE `article_date` IS NOT NULL ORDER BY `year`;"
+        )
+        return [row["year"] for row in self.cursor.fetchall()]
+
+    def get_summaries(self, table: str, year: int | None = None, batch_size: int = 1000):
+        """### Yields `(post_id, summary, location, period, ai_extract, article_date)` of the articles of `year`,
+        of all of them without one, streamed in batches"""
+        query = f"SELECT `post_id`, `summary`, `location`, `period`, `ai_extract`, `article_date` FROM {table}"
+        params = ()
+        if year is not None:
+            query += " WHERE `article_date` >= %s AND `article_date` < %s"
+            params = (f"{year}-01-01", f"{year + 1}-01-01")
+
+        cursor = self.connection.cursor(buffered=False)
+        try:
+            cursor.execute(query + ";", params)
+            while rows := cursor.fetchmany(batch_size):
+                yield from rows
+        finally:
+            cursor.close()
+
+    def execute_chunks(
+        self, query: str, rows: list, chunk_size: int, prepared: bool = False
+    ) -> int:
+        """### Runs `executemany` for every `chunk_size` rows and commits each chunk on its own.
+        `prepared` sends the statement to the server once and only the parameters for every row,
+        otherwise INSERTs are rewritten into one multi-row statement. A chunk that loses its connection is retried once"""
+        written = 0
+
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start : start + chunk_size]
+
+            for attempt in range(2):
+                try:
+                    if prepared and self.prepared_cursor is None:
+                        self.prepared_cursor = self.connection.cursor(prepared=True)
+
+                    cursor = self.prepared_cursor if prepared else self.cursor
+                    with metrics.timer("db_commit"):
+                        cursor.executemany(query, chunk)
+                        self.connection.commit()
+                    written += len(chunk)
+                    metrics.count("db_rows_written", len(chunk))
+                    break
+                except (mysql.connector.OperationalError, mysql.connector.InterfaceError) as err:
+                    if attempt > 0:
+                        metrics.count("db_errors")
+                        print(
+                            f"[DB] Error: {err}\n[DB] Could NOT write rows {start} to {start + len(chunk)}"
+                        )
+                        break
+                    print(f"[DB] Lost the connection: {err}")
+                    metrics.count("db_reconnects")
+                    self.reconnect()
+                except mysql.connector.Error as err:
+                    self.connection.rollback()
+                    metrics.count("db_errors")
+                    print(
+                        f"[DB] Error: {err}\n[DB] Could NOT write rows {start} to {start + len(chunk)}"
+                    )
+                    break
+
+        return written
@@ -17,8 +17,13 @@ CREATE TABLE IF NOT EXISTS `vik_gpt_4o_mini` (
   `comments` text CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci COMMENT 'Коментарите от съобщението',
   `date_added` datetime NOT NULL DEFAULT (now()),
   `article_date` date DEFAULT NULL,
+  `period_start` datetime DEFAULT NULL COMMENT 'Началото на периода, NULL ако не е указано',
+  `period_end` datetime DEFAULT NULL COMMENT 'Краят на периода, NULL ако не е указан',
   `date_updated` datetime NOT NULL DEFAULT (now()),
-  UNIQUE KEY `post_id` (`post_id`)
+  UNIQUE KEY `post_id` (`post_id`),
+  KEY `article_date` (`article_date`),
+  KEY `period_end` (`period_end`, `period_start`),
+  KEY `period_start` (`period_start`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 
 -- Dumping structure for table vik_scraper.vik_gpt_4o_mini_edited
@@ -36,7 +41,153 @@ CREATE TABLE IF NOT EXISTS `vik_gpt_4o_mini_edited` (
   `comments` text CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci COMMENT 'Коментарите от съобщението',
   `date_added` datetime NOT NULL DEFAULT (now()),
   `article_date` date DEFAULT NULL,
-  UNIQUE KEY `summary` (`summary`(750)),
+  `period_start` datetime DEFAULT NULL COMMENT 'Началото на периода, NULL ако не е указано',
+  `period_end` datetime DEFAULT NULL COMMENT 'Краят на периода, NULL ако не е указан',
+  `date_archived` datetime NOT NULL DEFAULT (now()) COMMENT 'Кога е преместено съобщението в тази таблица',
+  UNIQUE KEY `summary` (`summary`(700), `date_archived`),
   KEY `Foreign Key - post_id` (`post_id`),
+  KEY `article_date` (`article_date`),
   CONSTRAINT `Foreign Key - post_id` FOREIGN KEY (`post_id`) REFERENCES `vik_gpt_4o_mini` (`post_id`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci COMMENT='Таблица в коята се местят съобщенията които са били променени след началното им извличане от сайта';
+
+-- Dumping structure for table vik_scraper.vik_settlements
+CREATE TABLE IF NOT EXISTS `vik_settlements` (
+  `id` smallint unsigned NOT NULL COMMENT 'ID от data/settlements.csv',
+  `kind` varchar(8) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL COMMENT 'гр. или с.',
+  `name` varchar(64) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL COMMENT 'Името на града или селото',
+  `municipality` varchar(64) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL COMMENT 'Общината',
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `kind_name` (`kind`, `name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci COMMENT='Градовете и селата в областта, зареждат се с python gazetteer.py load';
+
+-- Dumping data for table vik_scraper.vik_settlements: 112 rows from data/settlements.csv, `python gazetteer.py load` writes the later changes
+INSERT INTO `vik_settlements` (`id`, `kind`, `name`, `municipality`) VALUES
+	(1, 'гр.', 'Пазарджик', 'Пазарджик'),
+	(2, 'с.', 'Алеко Константиново', 'Пазарджик'),
+	(3, 'с.', 'Априлци', 'Пазарджик'),
+	(4, 'с.', 'Братаница', 'Пазарджик'),
+	(5, 'с.', 'Величково', 'Пазарджик'),
+	(6, 'с.', 'Гелеменово', 'Пазарджик'),
+	(7, 'с.', 'Главиница', 'Пазарджик'),
+	(8, 'с.', 'Говедаре', 'Пазарджик'),
+	(9, 'с.', 'Дебращица', 'Пазарджик'),
+	(10, 'с.', 'Добровница', 'Пазарджик'),
+	(11, 'с.', 'Драгор', 'Пазарджик'),
+	(12, 'с.', 'Звъничево', 'Пазарджик'),
+	(13, 'с.', 'Ивайло', 'Пазарджик'),
+	(14, 'с.', 'Иван Вазово', 'Пазарджик'),
+	(15, 'с.', 'Ляхово', 'Пазарджик'),
+	(16, 'с.', 'Мало Конаре', 'Пазарджик'),
+	(17, 'с.', 'Мирянци', 'Пазарджик'),
+	(18, 'с.', 'Мокрище', 'Пазарджик'),
+	(19, 'с.', 'Овчеполци', 'Пазарджик'),
+	(20, 'с.', 'Огняново', 'Пазарджик'),
+	(21, 'с.', 'Паталеница', 'Пазарджик'),
+	(22, 'с.', 'Писменово', 'Пазарджик'),
+	(23, 'с.', 'Пищигово', 'Пазарджик'),
+	(24, 'с.', 'Росен', 'Пазарджик'),
+	(25, 'с.', 'Сарая', 'Пазарджик'),
+	(26, 'с.', 'Сбор', 'Пазарджик'),
+	(27, 'с.', 'Синитово', 'Пазарджик'),
+	(28, 'с.', 'Тополи дол', 'Пазарджик'),
+	(29, 'с.', 'Хаджиево', 'Пазарджик'),
+	(30, 'с.', 'Црънча', 'Пазарджик'),
+	(31, 'с.', 'Черногорово', 'Пазарджик'),
+	(32, 'с.', 'Юнаците', 'Пазарджик'),
+	(33, 'гр.', 'Септември', 'Септември'),
+	(34, 'гр.', 'Ветрен', 'Септември'),
+	(35, 'с.', 'Бошуля', 'Септември'),
+	(36, 'с.', 'Варвара', 'Септември'),
+	(37, 'с.', 'Ветрен дол', 'Септември'),
+	(38, 'с.', 'Виноградец', 'Септември'),
+	(39, 'с.', 'Горно Вършило', 'Септември'),
+	(40, 'с.', 'Долно Вършило', 'Септември'),
+	(41, 'с.', 'Злокучене', 'Септември'),
+	(42, 'с.', 'Карабунар', 'Септември'),
+	(43, 'с.', 'Ковачево', 'Септември'),
+	(44, 'с.', 'Лозен', 'Септември'),
+	(45, 'с.', 'Семчиново', 'Септември'),
+	(46, 'с.', 'Симеоновец', 'Септември'),
+	(47, 'с.', 'Славовица', 'Септември'),
+	(48, 'с.', 'Лесичово', 'Лесичово'),
+	(49, 'с.', 'Боримечково', 'Лесичово'),
+	(50, 'с.', 'Динката', 'Лесичово'),
+	(51, 'с.', 'Калугерово', 'Лесичово'),
+	(52, 'с.', 'Памидово', 'Лесичово'),
+	(53, 'с.', 'Церово', 'Лесичово'),
+	(54, 'с.', 'Щърково', 'Лесичово'),
+	(55, 'гр.', 'Пещера', 'Пещера'),
+	(56, 'с.', 'Радилово', 'Пещера'),
+	(57, 'с.', 'Капитан Димитриево', 'Пещера'),
+	(58, 'гр.', 'Брацигово', 'Брацигово'),
+	(59, 'с.', 'Бяга', 'Брацигово'),
+	(60, 'с.', 'Жребичко', 'Брацигово'),
+	(61, 'с.', 'Исперихово', 'Брацигово'),
+	(62, 'с.', 'Козарско', 'Брацигово'),
+	(63, 'с.', 'Равногор', 'Брацигово'),
+	(64, 'с.', 'Розово', 'Брацигово'),
+	(65, 'гр.', 'Белово', 'Белово'),
+	(66, 'с.', 'Аканджиево', 'Белово'),
+	(67, 'с.', 'Габровица', 'Белово'),
+	(68, 'с.', 'Голямо Белово', 'Белово'),
+	(69, 'с.', 'Дъбравите', 'Белово'),
+	(70, 'с.', 'Мененкьово', 'Белово'),
+	(71, 'с.', 'Момина клисура', 'Белово'),
+	(72, 'с.', 'Сестримо', 'Белово'),
+	(73, 'гр.', 'Батак', 'Батак'),
+	(74, 'с.', 'Нова махала', 'Батак'),
+	(75, 'с.', 'Фотиново', 'Батак'),
+	(76, 'гр.', 'Велинград', 'Велинград'),
+	(77, 'с.', 'Абланица', 'Велинград'),
+	(78, 'с.', 'Биркова', 'Велинград'),
+	(79, 'с.', 'Бозьова', 'Велинград'),
+	(80, 'с.', 'Враненци', 'Велинград'),
+	(81, 'с.', 'Всемирци', 'Велинград'),
+	(82, 'с.', 'Горна Дъбева', 'Велинград'),
+	(83, 'с.', 'Грашево', 'Велинград'),
+	(84, 'с.', 'Долна Дъбева', 'Велинград'),
+	(85, 'с.', 'Драгиново', 'Велинград'),
+	(86, 'с.', 'Кандови', 'Велинград'),
+	(87, 'с.', 'Медени поляни', 'Велинград'),
+	(88, 'с.', 'Пашови', 'Велинград'),
+	(89, 'с.', 'Рохлева', 'Велинград'),
+	(90, 'с.', 'Света Петка', 'Велинград'),
+	(91, 'с.', 'Цветино', 'Велинград'),
+	(92, 'с.', 'Чолаковци', 'Велинград'),
+	(93, 'с.', 'Юндола', 'Велинград'),
+	(94, 'гр.', 'Ракитово', 'Ракитово'),
+	(95, 'гр.', 'Костандово', 'Ракитово'),
+	(96, 'с.', 'Дорково', 'Ракитово'),
+	(97, 'гр.', 'Сърница', 'Сърница'),
+	(98, 'гр.', 'Панагюрище', 'Панагюрище'),
+	(99, 'с.', 'Баня', 'Панагюрище'),
+	(100, 'с.', 'Бъта', 'Панагюрище'),
+	(101, 'с.', 'Елшица', 'Панагюрище'),
+	(102, 'с.', 'Левски', 'Панагюрище'),
+	(103, 'с.', 'Оборище', 'Панагюрище'),
+	(104, 'с.', 'Панагюрски колонии', 'Панагюрище'),
+	(105, 'с.', 'Петрич', 'Панагюрище'),
+	(106, 'с.', 'Поибрене', 'Панагюрище'),
+	(107, 'с.', 'Попинци', 'Панагюрище'),
+	(108, 'гр.', 'Стрелча', 'Стрелча'),
+	(109, 'с.', 'Блатница', 'Стрелча'),
+	(110, 'с.', 'Дюлево', 'Стрелча'),
+	(111, 'с.', 'Свобода', 'Стрелча'),
+	(112, 'с.', 'Малко Белово', 'Белово')
+  ON DUPLICATE KEY UPDATE `kind` = VALUES(`kind`), `name` = VALUES(`name`), `municipality` = VALUES(`municipality`);
+
+-- Dumping structure for table vik_scraper.vik_gpt_4o_mini_places
+CREATE TABLE IF NOT EXISTS `vik_gpt_4o_mini_places` (
+  `post_id` varchar(50) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL COMMENT 'ID на съобщението в сайта',
+  `place` varchar(128) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL COMMENT 'Един град или село от location',
+  `place_id` smallint unsigned DEFAULT NULL COMMENT 'ID на населеното място, NULL ако го няма в списъка',
+  `article_date` date DEFAULT NULL,
+  `period_start` datetime DEFAULT NULL COMMENT 'Началото на периода, NULL ако не е указано',
+  `period_end` datetime DEFAULT NULL COMMENT 'Краят на периода, NULL ако не е указан',
+  PRIMARY KEY (`post_id`, `place`),
+  KEY `place_date` (`place`, `article_date`),
+  KEY `place_id_date` (`place_id`, `article_date`),
+  KEY `period` (`period_start`, `period_end`),
+  CONSTRAINT `Foreign Key - places post_id` FOREIGN KEY (`post_id`) REFERENCES `vik_gpt_4o_mini` (`post_id`) ON DELETE CASCADE,
+  CONSTRAINT `Foreign Key - places place_id` FOREIGN KEY (`place_id`) REFERENCES `vik_settlements` (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci COMMENT='Населените места на всяко съобщение с началото и края на периода';
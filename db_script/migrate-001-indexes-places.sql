@@ -0,0 +1,19 @@
+-- Indexes for date range lookups and a normalized table of the places of every outage
+-- Run once on an existing vik_scraper database, then fill the new table with `python places.py backfill`
+USE `vik_scraper`;
+
+ALTER TABLE `vik_gpt_4o_mini` ADD INDEX `article_date` (`article_date`);
+ALTER TABLE `vik_gpt_4o_mini_edited` ADD INDEX `article_date` (`article_date`);
+
+-- Dumping structure for table vik_scraper.vik_gpt_4o_mini_places
+CREATE TABLE IF NOT EXISTS `vik_gpt_4o_mini_places` (
+  `post_id` varchar(50) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL COMMENT 'ID на съобщението в сайта',
+  `place` varchar(128) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL COMMENT 'Един град или село от location',
+  `article_date` date DEFAULT NULL,
+  `period_start` datetime DEFAULT NULL COMMENT 'Началото на периода, NULL ако не е указано',
+  `period_end` datetime DEFAULT NULL COMMENT 'Краят на периода, NULL ако не е указан',
+  PRIMARY KEY (`post_id`, `place`),
+  KEY `place_date` (`place`, `article_date`),
+  KEY `period` (`period_start`, `period_end`),
+  CONSTRAINT `Foreign Key - places post_id` FOREIGN KEY (`post_id`) REFERENCES `vik_gpt_4o_mini` (`post_id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci COMMENT='Населените места на всяко съобщение с началото и края на периода';
@@ -0,0 +1,13 @@
+-- Parsed start and end of the period on the articles, for duration, overlap and "what is out right now" queries
+-- Run once on an existing vik_scraper database, then `python period.py backfill` and `python places.py backfill`
+USE `vik_scraper`;
+
+ALTER TABLE `vik_gpt_4o_mini`
+  ADD COLUMN `period_start` datetime DEFAULT NULL COMMENT 'Началото на периода, NULL ако не е указано' AFTER `article_date`,
+  ADD COLUMN `period_end` datetime DEFAULT NULL COMMENT 'Краят на периода, NULL ако не е указан' AFTER `period_start`,
+  ADD KEY `period_end` (`period_end`, `period_start`),
+  ADD KEY `period_start` (`period_start`);
+
+ALTER TABLE `vik_gpt_4o_mini_edited`
+  ADD COLUMN `period_start` datetime DEFAULT NULL COMMENT 'Началото на периода, NULL ако не е указано' AFTER `article_date`,
+  ADD COLUMN `period_end` datetime DEFAULT NULL COMMENT 'Краят на периода, NULL ако не е указан' AFTER `period_start`;
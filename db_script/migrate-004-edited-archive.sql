@@ -0,0 +1,8 @@
+-- Keep every archived version of an article, not only the first one of its summary.
+-- Reprocessing changes the place and period but keeps the summary, so the old unique key dropped the later versions
+USE `vik_scraper`;
+
+ALTER TABLE `vik_gpt_4o_mini_edited`
+  ADD COLUMN `date_archived` datetime NOT NULL DEFAULT (now()) COMMENT 'Кога е преместено съобщението в тази таблица' AFTER `period_end`,
+  DROP INDEX `summary`,
+  ADD UNIQUE KEY `summary` (`summary`(700), `date_archived`);
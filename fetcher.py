@@ -0,0 +1,207 @@
+import json, os, threading, requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, sleep
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from atomic import atomic_write_json
+from cache import PageCache
+from metrics import metrics
+
+
+# Returned by `Fetcher.fetch` when the server answered 304 to a conditional request
+NOT_MODIFIED = object()
+
+# Responses worth retrying, everything else non-200 is final
+retry_statuses = {429, 500, 502, 503, 504}
+
+
+class Fetcher:
+    """### Fetches pages through a bounded worker pool with a per-host politeness delay.
+    Uses one pooled session, retries with exponential backoff and `ETag`/`Last-Modified` conditional requests"""
+
+    def __init__(
+        self,
+        workers: int = 4,
+        delay: float = 0.5,
+        timeout: float = 30,
+        retries: int = 4,
+        backoff: float = 1.0,
+        backoff_cap: float = 30.0,
+        validators_file: str | None = None,
+        cache: PageCache | None = None,
+    ):
+        self.workers: int = max(1, workers)  # Maximum requests in flight at once
+        self.delay: float = delay  # Minimum seconds between two requests to the same host
+        self.timeout: float = timeout
+        self.retries: int = retries  # Attempts after the first one
+        self.backoff: float = backoff  # Seconds before the first retry, doubled on every next one
+        self.backoff_cap: float = backoff_cap
+
+        self.lock = threading.Lock()
+        self.next_slot: dict = {}  # host -> earliest monotonic time for the next request
+
+        # Keep-alive connections shared by all workers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # url -> {"etag": ..., "last_modified": ...} from previous runs
+        self.validators_file = validators_file
+        self.validators: dict = self.load_validators()
+        self.new_validators: dict = {}
+
+        # Raw responses on disk, in replay mode nothing else is used
+        self.cache: PageCache | None = cache
+
+        self.stats: dict = {"requests": 0, "bytes": 0, "retries": 0, "not_modified": 0}
+
+    def load_validators(self) -> dict:
+        if self.validators_file and os.path.exists(self.validators_file):
+            with open(self.validators_file, "r", encoding="utf-8") as f:
+                try:
+                    return json.load(f)
+                except json.JSONDecodeError:
+                    return {}
+        return {}
+
+    def save_validators(self):
+        """Persists the validators of this run. Call it only after the pages were processed successfully,
+        otherwise the next run would get a 304 for pages that never made it to the DB"""
+        if not self.validators_file or not self.new_validators:
+            return
+
+        self.validators.update(self.new_validators)
+        self.new_validators = {}
+        atomic_write_json(self.validators_file, self.validators, ensure_ascii=False, indent=4)
+
+    def discard_validators(self):
+        """Forgets the validators of a run that was stopped or failed, its pages are loaded in full next time"""
+        self.new_validators = {}
+
+    def count(self, key: str, amount: int = 1):
+        with self.lock:
+            self.stats[key] += amount
+        metrics.count(f"fetch_{key}", amount)
+
+    def wait_turn(self, url: str):
+        """Blocks until the politeness delay for the host of `url` has passed"""
+        host = urlsplit(url).netloc
+
+        with self.lock:
+            now = monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.delay
+
+        if slot > now:
+            sleep(slot - now)
+
+    def fetch(self, url: str, conditional: bool = True):
+        """Returns the body of `url`, `NOT_MODIFIED` if it did not change since the last run
+        or `None` if it could not be loaded"""
+        if self.cache is not None:
+            content = self.cache.get(url)
+            metrics.count("page_cache_hits" if content is not None else "page_cache_misses")
+            if content is not None:
+                return content
+
+            if self.cache.replay:
+                print(f"[Fetcher] {url} is not in the cache, skipping it in replay mode")
+
+                return None
+
+        headers = {}
+        validator = self.validators.get(url) if conditional else None
+        if validator:
+            if validator.get("etag"):
+                headers["If-None-Match"] = validator["etag"]
+            if validator.get("last_modified"):
+                headers["If-Modified-Since"] = validator["last_modified"]
+
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                self.count("retries")
+                sleep(min(self.backoff_cap, self.backoff * 2 ** (attempt - 1)))
+
+            self.wait_turn(url)
+            self.count("requests")
+
+            try:
+                with metrics.timer("fetch"):
+                    response = self.session.get(url, headers=headers, timeout=self.timeout)
+            except requests.RequestException as err:
+                print(f"[Fetcher] Error: {err}")
+                continue
+
+            if response.status_code in retry_statuses:
+                print(f"[{response.status_code}] Retrying {url}")
+                continue
+
+            break
+        else:
+            print(f"[Fetcher] Giving up on {url} after {self.retries + 1} attempts")
+
+            return None
+
+        self.count("bytes", len(response.content))
+
+        if response.status_code == 304:
+            self.count("not_modified")
+
+            return NOT_MODIFIED
+
+        if response.status_code == 200:
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            if etag or last_modified:
+                with self.lock:
+                    self.new_validators[url] = {"etag": etag, "last_modified": last_modified}
+
+            if self.cache is not None:
+                # The page is here either way, a full disk or a broken cache must not fail the fetch
+                try:
+                    self.cache.put(url, response.content)
+                except OSError as err:
+                    metrics.count("page_cache_errors")
+                    print(f"[Fetcher] Could not cache {url}: {err}")
+
+            return response.content
+
+        print(f"[{response.status_code}] Could not reach website {url}")
+
+        return None
+
+    def fetch_pages(self, urls, conditional: bool = True):
+        """Yields `(url, content)` in the order of `urls` while the next ones load in the background.
+        At most `workers` requests are in flight, closing the generator cancels the ones not started yet.
+        Without `conditional` every page is loaded in full, even if it did not change since the last run"""
+        urls = iter(urls)
+        pending = deque()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for url in urls:
+                pending.append((url, executor.submit(self.fetch, url, conditional)))
+                if len(pending) >= self.workers:
+                    break
+
+            try:
+                while pending:
+                    url, future = pending.popleft()
+
+                    # Keep the pool busy while the caller parses this page
+                    next_url = next(urls, None)
+                    if next_url is not None:
+                        pending.append((next_url, executor.submit(self.fetch, next_url, conditional)))
+
+                    yield url, future.result()
+            finally:
+                for _, future in pending:
+                    future.cancel()
+
+    def print_stats(self):
+        print(
+            f"[Fetcher] {self.stats['requests']} requests, {self.stats['bytes']} bytes, {self.stats['retries']} retries, {self.stats['not_modified']} not modified"
+        )
+        if self.cache is not None:
+            self.cache.print_stats()
@@ -0,0 +1,170 @@
+"""Towns and villages of the Pazardzhik region from `data/settlements.csv`, used to store every place in one form.
+"с.КОВАЧЕВО", "село Ковачево" and "с. Ковачево" all become "с. Ковачево" with the ID of the settlement,
+misspelled names are matched through a trigram index. `python gazetteer.py load` copies the file to the DB"""
+
+import csv, os, re, sys
+from dataclasses import dataclass
+
+
+data_file: str = os.path.join(os.path.dirname(__file__), "data", "settlements.csv")
+
+prefix_pattern = re.compile(r"^\s*(гр\.|град\b|с\.|село\b)\s*", re.IGNORECASE)
+kinds: dict = {"гр.": "гр.", "град": "гр.", "с.": "с.", "село": "с."}
+
+# Latin letters that look like Cyrillic ones and slip into the notices
+lookalikes = str.maketrans("aceopxykmthbACEOPXYKMTHB", "асеорхукмтнвАСЕОРХУКМТНВ")
+quotes_pattern = re.compile(r"[„\"“”'`]")
+
+fuzzy_threshold: float = 0.7  # Dice similarity of the trigrams
+fuzzy_min_length: int = 5  # Shorter names are only matched exactly
+
+
+@dataclass(slots=True, frozen=True)
+class Settlement:
+    id: int
+    kind: str
+    name: str
+    municipality: str
+
+    @property
+    def canonical(self) -> str:
+        return f"{self.kind} {self.name}"
+
+
+def split_kind(place: str) -> tuple[str | None, str]:
+    """ "с.КОВАЧЕВО" -> ("с.", "КОВАЧЕВО")"""
+    place = " ".join(quotes_pattern.sub("", place).split())
+    match = prefix_pattern.match(place)
+    if match is None:
+        return None, place
+
+    return kinds[match.group(1).lower()], place[match.end() :]
+
+
+def normalize(name: str) -> str:
+    return " ".join(name.translate(lookalikes).lower().replace("-", " ").split())
+
+
+def trigrams(key: str) -> set:
+    padded = f"  {key} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class Gazetteer:
+    """### Exact and fuzzy lookup of settlements by name.
+    Names are keyed lowercase without their "гр."/"с." prefix, a miss falls back to the settlements
+    that share the most trigrams with it. Lookups are memoized, the same few hundred places repeat in every notice"""
+
+    def __init__(self, path: str = data_file):
+        self.settlements: dict = {}  # id -> Settlement
+        self.by_name: dict = {}  # normalized name -> [Settlement]
+        self.grams: dict = {}  # id -> trigrams of the name
+        self.index: dict = {}  # trigram -> {id}
+        self.memo: dict = {}
+
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                self.add(Settlement(int(row["id"]), row["kind"], row["name"], row["municipality"]))
+
+    def add(self, settlement: Settlement):
+        key = normalize(settlement.name)
+        self.settlements[settlement.id] = settlement
+        self.by_name.setdefault(key, []).append(settlement)
+        self.grams[settlement.id] = trigrams(key)
+        for gram in self.grams[settlement.id]:
+            self.index.setdefault(gram, set()).add(settlement.id)
+
+    def lookup(self, place: str) -> Settlement | None:
+        """The settlement of "с. Мало Конаре" and its misspellings, `None` when nothing is close enough"""
+        if place in self.memo:
+            return self.memo[place]
+
+        kind, name = split_kind(place)
+        key = normalize(name)
+        candidates = self.by_name.get(key) or self.fuzzy(key)
+        settlement = None
+        if candidates:
+            # A town and a village can share a name, the prefix decides between them
+            settlement = next((item for item in candidates if item.kind == kind), candidates[0])
+
+        self.memo[place] = settlement
+        return settlement
+
+    def fuzzy(self, key: str) -> list:
+        if len(key) < fuzzy_min_length:
+            return []
+
+        grams = trigrams(key)
+        shared: dict = {}
+        for gram in grams:
+            for settlement_id in self.index.get(gram, ()):
+                shared[settlement_id] = shared.get(settlement_id, 0) + 1
+
+        best, best_score = None, fuzzy_threshold
+        for settlement_id, count in shared.items():
+            score = 2 * count / (len(grams) + len(self.grams[settlement_id]))
+            if score >= best_score:
+                best, best_score = settlement_id, score
+
+        return [self.settlements[best]] if best is not None else []
+
+    def canonical(self, place: str) -> tuple[str, int | None]:
+        """One place in its stored form and the ID of its settlement.
+        Unknown places keep their name with a tidied prefix and get no ID"""
+        settlement = self.lookup(place)
+        if settlement is not None:
+            return settlement.canonical, settlement.id
+
+        kind, name = split_kind(place)
+        if name.isupper():
+            name = name.title()
+
+        return (f"{kind} {name}" if kind else name), None
+
+    def canonical_location(self, places: list | str | None) -> str | None:
+        """ "с.КОВАЧЕВО, гр.Пазарджик" or a GPT list of places -> "с. Ковачево, гр. Пазарджик" without duplicates"""
+        if isinstance(places, str):
+            places = places.split(",")
+
+        names = (self.canonical(place)[0] for place in places or () if place.strip())
+        return ", ".join(dict.fromkeys(names)) or None
+
+
+# Loaded on first use, every worker process reads the file once
+default: Gazetteer | None = None
+
+
+def get() -> Gazetteer:
+    global default
+    if default is None:
+        default = Gazetteer()
+
+    return default
+
+
+def canonical_location(places: list | str | None) -> str | None:
+    return get().canonical_location(places)
+
+
+def place_id(place: str) -> int | None:
+    settlement = get().lookup(place)
+    return settlement.id if settlement is not None else None
+
+
+def load(table: str = "vik_settlements") -> int:
+    """Copies the settlements to `table` so the places tables can join on their IDs"""
+    from db import Database
+
+    with Database() as db:
+        written = db.upsert_settlements(table, list(get().settlements.values()))
+
+    print(f"[Gazetteer] Wrote {written} settlements to {table}")
+    return written
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "load":
+        load()
+    else:
+        print("Usage: python gazetteer.py load")
+        sys.exit(1)
@@ -0,0 +1,63 @@
+import hashlib, json, os, threading
+from atomic import atomic_write_json
+
+
+def content_hash(content: bytes | str) -> str:
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+
+    return hashlib.sha256(content).hexdigest()
+
+
+class Manifest:
+    """### What the listing pages of a year looked like when they were last written to the DB.
+    Keeps the content hash and post IDs of every page and the hash of every article, so an incremental run
+    re-parses only the articles that changed and stops at the first page that has nothing new.
+    `owed_page` is the deepest page a stopped or failed run still owes, no run stops early before it got past it"""
+
+    def __init__(self, path: str):
+        self.path: str = path
+        self.lock = threading.Lock()
+        self.state: dict = self.load()
+
+    def load(self) -> dict:
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                try:
+                    return json.load(f)
+                except json.JSONDecodeError:
+                    print(f"[Manifest] {self.path} is broken, starting over")
+
+        return {"pages": {}, "articles": {}, "owed_page": None}
+
+    def save(self):
+        with self.lock:
+            atomic_write_json(self.path, self.state, ensure_ascii=False)
+
+    def page_matches(self, page: int, page_hash: str) -> bool:
+        """The page is byte for byte what it was, so nothing was posted or edited since"""
+        known = self.state["pages"].get(str(page))
+        return known is not None and known["hash"] == page_hash
+
+    @property
+    def owed_page(self) -> int | None:
+        return self.state.get("owed_page")
+
+    def owe(self, page: int):
+        """Keeps the runs from stopping early before `page` until one of them finishes"""
+        with self.lock:
+            self.state["owed_page"] = max(self.state.get("owed_page") or 0, page)
+
+    def finish_run(self):
+        """A run got through all of its pages or up to the ones it already knew, nothing is owed anymore"""
+        with self.lock:
+            self.state["owed_page"] = None
+
+    def article_matches(self, post_id: str, article_hash: str) -> bool:
+        return self.state["articles"].get(post_id) == article_hash
+
+    def page_done(self, page: int, page_hash: str, articles: dict):
+        """Records a page once all of its articles (`post_id -> hash`) are committed"""
+        with self.lock:
+            self.state["pages"][str(page)] = {"hash": page_hash, "post_ids": list(articles)}
+            self.state["articles"].update(articles)
@@ -0,0 +1,194 @@
+"""Counters and stage timers of a run, reported by the fetcher, the scraper, the GPT extractor and the DB.
+Events and snapshots go to a JSON Lines log, the totals can also be written in the Prometheus text format
+to a file for the node exporter textfile collector or served on `metrics_port`"""
+
+import json, os, threading, config
+from contextlib import contextmanager
+from datetime import datetime
+from time import perf_counter
+from atomic import atomic_write
+
+
+log_file = config.path("metrics_log", "logs/metrics/metrics.jsonl")  # Empty turns the log off
+prometheus_file = config.path("metrics_prometheus_file")
+prometheus_port = int(config.get("metrics_port", "0"))  # 0 keeps the endpoint off
+
+# Upper bounds in seconds of the timer buckets, from a regex match to a slow GPT call
+buckets: tuple = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Stages with a timer, the Prometheus file always lists them even when a run never got there
+stages: tuple = ("fetch", "parse", "extract", "gpt", "db_commit")
+
+
+class Histogram:
+    """### Count, sum, min, max and cumulative bucket counts of the observed seconds"""
+
+    def __init__(self):
+        self.count: int = 0
+        self.sum: float = 0.0
+        self.min: float | None = None
+        self.max: float | None = None
+        self.buckets: list = [0] * len(buckets)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                self.buckets[i] += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            "buckets": list(self.buckets),
+        }
+
+    def merge(self, data: dict):
+        self.count += data["count"]
+        self.sum += data["sum"]
+        for key, pick in (("min", min), ("max", max)):
+            if data[key] is not None:
+                current = getattr(self, key)
+                setattr(self, key, data[key] if current is None else pick(current, data[key]))
+        self.buckets = [a + b for a, b in zip(self.buckets, data["buckets"])]
+
+
+class Metrics:
+    """### Thread safe registry of counters and timers, one per process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: dict = {}
+        self.timers: dict = {}
+        self.log = None
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.timers = {}
+
+    def count(self, name: str, amount: float = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, stage: str, seconds: float):
+        with self.lock:
+            histogram = self.timers.get(stage)
+            if histogram is None:
+                histogram = self.timers[stage] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """`with metrics.timer("parse"):` adds the seconds spent inside to the stage"""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, perf_counter() - start)
+
+    def event(self, name: str, **fields):
+        """Appends one JSON line to the metrics log"""
+        if not log_file:
+            return
+
+        line = json.dumps(
+            {"time": datetime.now().isoformat(), "pid": os.getpid(), "event": name, **fields},
+            ensure_ascii=False,
+            default=str,
+        )
+        with self.lock:
+            if self.log is None:
+                os.makedirs(os.path.dirname(log_file), exist_ok=True)
+                self.log = open(log_file, "a", encoding="utf-8")
+            self.log.write(line + "\n")
+            self.log.flush()
+
+    def snapshot(self) -> dict:
+        """Picklable copy of everything counted so far"""
+        with self.lock:
+            return {
+                "counters": dict(self.counters),
+                "timers": {stage: histogram.to_dict() for stage, histogram in self.timers.items()},
+            }
+
+    def merge(self, snapshot: dict):
+        """Adds the `snapshot` of another process, worker processes send theirs back with the results"""
+        with self.lock:
+            for name, amount in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + amount
+            for stage, data in snapshot["timers"].items():
+                self.timers.setdefault(stage, Histogram()).merge(data)
+
+    def prometheus(self) -> str:
+        snapshot = self.snapshot()
+        lines = []
+
+        for name, amount in sorted(snapshot["counters"].items()):
+            lines.append(f"# TYPE vik_scraper_{name}_total counter")
+            lines.append(f"vik_scraper_{name}_total {amount}")
+
+        lines.append("# TYPE vik_scraper_stage_seconds histogram")
+        for stage in sorted(set(stages) | set(snapshot["timers"])):
+            data = snapshot["timers"].get(stage, Histogram().to_dict())
+            for bound, amount in zip(buckets, data["buckets"]):
+                lines.append(f'vik_scraper_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {amount}')
+            lines.append(f'vik_scraper_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {data["count"]}')
+            lines.append(f'vik_scraper_stage_seconds_sum{{stage="{stage}"}} {data["sum"]}')
+            lines.append(f'vik_scraper_stage_seconds_count{{stage="{stage}"}} {data["count"]}')
+
+        return "\n".join(lines) + "\n"
+
+    def flush(self, name: str = "snapshot", **fields):
+        """Logs a snapshot and rewrites the Prometheus file if one is set"""
+        self.event(name, **fields, **self.snapshot())
+
+        if prometheus_file:
+            atomic_write(prometheus_file, self.prometheus(), fsync=False)
+
+    def serve(self, port: int = prometheus_port):
+        """Serves `/metrics` on `port` from a background thread, returns the server or `None` when the port is 0"""
+        if not port:
+            return None
+
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                body = registry.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"[Metrics] Serving /metrics on port {port}")
+
+        return server
+
+    def print_stats(self):
+        snapshot = self.snapshot()
+        for stage, data in sorted(snapshot["timers"].items()):
+            print(
+                f"[Metrics] {stage}: {data['count']} in {data['sum']:.3f} seconds ({data['sum'] / max(1, data['count']) * 1000:.2f} ms each)"
+            )
+        if snapshot["counters"]:
+            print(
+                "[Metrics] " + ", ".join(f"{name} {amount:g}" for name, amount in sorted(snapshot["counters"].items()))
+            )
+
+
+# The registry of this process
+metrics = Metrics()
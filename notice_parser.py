@@ -0,0 +1,142 @@
+"""Rule-based parser for the outage notices of vikpz.com.
+Produces the same shape as the GPT prompt in `ai.py` so most articles never need GPT"""
+
+import re
+
+
+# Order matters, dates have to win over the times they contain ("05.08.2024" vs "05.08")
+token_pattern = re.compile(
+    r"""
+    (?P<date>\b\d{1,2}\.\d{1,2}\.\d{4}\b)
+    | (?P<time>\b\d{1,2}[,.:]\d{2}\b | \b\d{1,2}(?=\s*(?:ч\.|ч\b|часа)) | \b\d{1,2}(?=\s+до\s+\d{1,2}(?:[,.:]\d{2})?\s*(?:ч\.|ч\b|часа)))
+    | (?P<places>\b(?:селата|населените\s+места)\s+
+        [А-ЯA-Z][\w-]*(?:\s+[А-ЯA-Z][\w-]*)?
+        (?:\s*(?:,|\bи\b)\s*[А-ЯA-Z][\w-]*(?:\s+[А-ЯA-Z][\w-]*)?)*)
+    | (?P<place>(?:\bгр\.|\bград\b|\bс\.|\bсело\b)\s*[А-ЯA-Z][\w-]*(?:\s+(?:[А-ЯA-Z][\w-]*|дол|поле|баня|река))?)
+    | (?P<street>\bул\.\s*[„"“]?[^,.;„"“”]+?[”"“]?(?:\s*№\s*\d+\w?)?(?=\s*(?:,|\.|;|\bв\b|\bот\b|\bдо\b|\bи\b|$)))
+    | (?P<neighbourhood>\bкв\.\s*[„"“]?[^,.;„"“”]+?[”"“]?(?=\s*(?:,|\.|;|\bв\b|\bот\b|\bдо\b|\bи\b|$)))
+    | (?P<word>\w+)
+    """,
+    re.VERBOSE,
+)
+quotes_pattern = re.compile(r"[„\"“”]")
+place_prefix_pattern = re.compile(r"^(?:гр\.|град|с\.|село)\s*")
+details_patterns = (
+    re.compile(r"\b[Пп]оради\s+(.+?)(?=,|\.\s|\s+(?:ще|е|са|се|бе|в)\s|\s+на\s+ул\.|$)"),
+    re.compile(r"\b(ПС\s*[„\"“]?[^,.;„\"“”]*[”\"“]?)"),
+    re.compile(r"\b(Електроразпределение\s+Юг|ЕВН|EVN)\b"),
+)
+
+# Words allowed between "от"/"до" and their hour, or between an hour and its date
+filler_words = {"часа", "ч", "около", "на", "г", "в", "периода", "времето"}
+default_place = "гр. Пазарджик"
+unknown_period = "не е указан"
+
+
+def tokenize(summary: str) -> list:
+    """Splits the summary into `(kind, text)` tokens"""
+    return [(match.lastgroup, match.group()) for match in token_pattern.finditer(summary)]
+
+
+def format_time(text: str) -> str:
+    hour, *minutes = re.split(r"[,.:]", text)
+    return f"{int(hour):02d}:{minutes[0] if minutes else '00'}"
+
+
+def format_date(text: str) -> str:
+    day, month, year = text.split(".")
+    return f"{int(day):02d}.{int(month):02d}.{year}"
+
+
+def place_name(text: str) -> str:
+    """Name without its prefix, upper case names like "КОВАЧЕВО" become "Ковачево" """
+    name = " ".join(place_prefix_pattern.sub("", text).split())
+    return name.title() if name.isupper() else name
+
+
+def parse_notice(summary: str, article_date: str) -> tuple[dict, bool]:
+    """Returns the GPT shaped data and whether it is complete enough to skip GPT"""
+    places: list = []
+    streets: list = []
+    neighbourhoods: list = []
+    slots: dict = {"start": {}, "end": {}}
+    general_date = None
+
+    expecting = None  # Slot waiting for its hour after "от"/"до"
+    last_slot = None  # Slot that takes a date following its hour
+
+    for kind, text in tokenize(summary):
+        if kind == "word":
+            word = text.lower()
+            if word == "от":
+                expecting = "start"
+            elif word == "до":
+                expecting = "end"
+            elif word not in filler_words:
+                expecting = None
+                last_slot = None
+        elif kind == "time":
+            if expecting and "time" not in slots[expecting]:
+                slots[expecting]["time"] = format_time(text)
+                last_slot = expecting
+            expecting = None
+        elif kind == "date":
+            if last_slot and "date" not in slots[last_slot]:
+                slots[last_slot]["date"] = format_date(text)
+            elif general_date is None:
+                general_date = format_date(text)
+            last_slot = None
+        elif kind == "place":
+            prefix = "гр." if text.startswith(("гр", "град")) else "с."
+            places.append(f"{prefix} {place_name(text)}")
+        elif kind == "places":
+            names = re.sub(r"^(?:селата|населените\s+места)\s+", "", text)
+            places.extend(
+                f"с. {place_name(name)}" for name in re.split(r"\s*(?:,|\bи\b)\s*", names) if name
+            )
+        elif kind == "street":
+            streets.append(" ".join(quotes_pattern.sub("", text).replace("ул.", "ул. ", 1).split()))
+        elif kind == "neighbourhood":
+            neighbourhoods.append(" ".join(quotes_pattern.sub("", text).replace("кв.", "кв. ", 1).split()))
+
+    # Streets without a town are in Pazardzhik most of the time
+    if not places and (streets or neighbourhoods):
+        places.append(default_place)
+    places = list(dict.fromkeys(places))
+
+    # Dates only go in brackets when they differ from the article date, like in the GPT answers
+    # one date is the end date and two are the start and end dates
+    start, end = slots["start"], slots["end"]
+    start_date = start.get("date") or general_date or article_date
+    end_date = end.get("date") or general_date or article_date
+    if start_date != article_date:
+        dates = [start_date, end_date]
+    elif end_date != article_date:
+        dates = [end_date]
+    else:
+        dates = []
+
+    if "time" not in start and "time" not in end:
+        period = unknown_period
+    else:
+        period = f"{start.get('time', '')} - {end.get('time', '')}".strip()
+        if dates:
+            period += f" ({' - '.join(dates)})"
+
+    details = []
+    for pattern in details_patterns:
+        for match in pattern.finditer(summary):
+            detail = match.group(1).strip()
+            # "ПС ..." alone adds nothing when the reason already mentions it
+            if detail and not any(detail.lower() in other.lower() for other in details):
+                details.append(detail[0].upper() + detail[1:])
+
+    data = {
+        "places": places,
+        "period": period,
+        "street": ", ".join(dict.fromkeys(streets)),
+        "neighbourhood": ", ".join(dict.fromkeys(neighbourhoods)),
+        "details": "; ".join(details),
+    }
+
+    return data, bool(places) and period != unknown_period
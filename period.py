@@ -0,0 +1,95 @@
+"""Start and end of the free text periods, the same for the RegEx, the rules and the GPT answers.
+`python period.py backfill` fills `period_start` and `period_end` of the articles stored before they existed"""
+
+import re, sys
+from datetime import date, datetime, timedelta
+from time import perf_counter
+
+
+time_pattern = re.compile(r"\b(\d{1,2})[:.,](\d{2})\b")
+date_pattern = re.compile(r"\b(\d{1,2})\.(\d{1,2})\.(\d{4})\b")
+
+
+def clock(text: str) -> tuple[int, int] | None:
+    """First "HH:mm" of the text, "24:00" is allowed for the end of the day"""
+    match = time_pattern.search(text)
+    if match is None:
+        return None
+
+    hour, minute = int(match.group(1)), int(match.group(2))
+    if minute > 59 or hour > 24 or (hour == 24 and minute > 0):
+        return None
+
+    return hour, minute
+
+
+def at(day: date, time: tuple[int, int] | None) -> datetime | None:
+    if time is None:
+        return None
+
+    return datetime(day.year, day.month, day.day) + timedelta(hours=time[0], minutes=time[1])
+
+
+def parse_period(period: str | None, article_date: date) -> tuple[datetime | None, datetime | None]:
+    """Start and end of a period anchored on the article date, missing sides are `None`.
+    "09:00 - 12:00" is on the article date and "22:00 - 06:00" ends the next day.
+    One date in brackets "09:00 - 12:00 (02.09.2024)" is the end date, two are the start and end dates.
+    "- 17:00" only has an end, "10:00 -" only a start and "не е указан" neither"""
+    if not period or "-" not in period:
+        return None, None
+
+    dates = []
+    for day, month, year in date_pattern.findall(period):
+        try:
+            dates.append(date(int(year), int(month), int(day)))
+        except ValueError:
+            pass
+
+    # Without the dates and brackets only the times are left around the first dash
+    start_text, _, end_text = re.sub(r"[()]", " ", date_pattern.sub("", period)).partition("-")
+    start_time, end_time = clock(start_text), clock(end_text)
+
+    if len(dates) >= 2:
+        start_day, end_day = dates[0], dates[-1]
+    elif dates:
+        start_day, end_day = article_date, dates[0]
+    else:
+        start_day = end_day = article_date
+        # Overnight, the water comes back the next day
+        if start_time is not None and end_time is not None and end_time <= start_time:
+            end_day = article_date + timedelta(days=1)
+
+    start, end = at(start_day, start_time), at(end_day, end_time)
+    if start is not None and end is not None and end <= start:
+        return start, None
+
+    return start, end
+
+
+def backfill(table: str, chunk_size: int = 500) -> int:
+    """Parses the period of every article in `table` again. Returns the number of rows written"""
+    from db import Database
+
+    start = perf_counter()
+    rows: list = []
+
+    with Database() as db:
+        for post_id, location, period, article_date in db.get_locations(table):
+            period_start, period_end = parse_period(period, article_date) if article_date else (None, None)
+            rows.append((period_start, period_end, post_id))
+
+        written = db.update_periods(table, rows, chunk_size)
+
+    print(f"[Period] Wrote {written} of {len(rows)} periods in {perf_counter() - start} seconds")
+    return written
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "backfill":
+        from ai import model
+        from record import table_name
+
+        backfill(sys.argv[2] if len(sys.argv) >= 3 else table_name(model))
+    else:
+        print("Usage: python period.py backfill [table]")
+        sys.exit(1)
@@ -0,0 +1,386 @@
+import queue, threading
+from collections import deque
+from datetime import datetime
+from time import perf_counter
+from article_parser import parse_articles
+from checkpoint import Checkpoint
+from fetcher import NOT_MODIFIED
+from manifest import content_hash
+from metrics import metrics
+from places import article_places
+from record import Article, summary_hash
+
+
+# Marks the end of a stage's output
+DONE = object()
+
+# Follows the entries of a page through the stages, `(PAGE_DONE, page, last post_id, page hash, {post_id: article hash})`
+PAGE_DONE = object()
+
+
+class NullDatabase:
+    """### Persist stage without MySQL for dry runs and replays, the entries only go to the JSON Lines files"""
+
+    def close_connection(self):
+        pass
+
+    def move_data(self, keys: list, table: str, chunk_size: int = 500) -> int:
+        return len(keys)
+
+    def bulk_upsert(self, table: str, rows: list, chunk_size: int = 500) -> int:
+        return len(rows)
+
+    def replace_places(self, table: str, keys: list, rows: list, chunk_size: int = 500) -> int:
+        return len(rows)
+
+
+class Pipeline:
+    """### Streams one scraper run through fetch -> parse -> enrich -> persist.
+    Every stage runs on its own thread, the bounded queues between them make a fast stage wait for a slow one.
+    Records are committed in chunks as they come, so a crash only loses the chunk in progress.
+    With a `checkpoint` every page is recorded once all of its entries are committed, the same goes for the scraper's manifest.
+    An incremental run with a manifest only parses the articles that changed since it was recorded"""
+
+    def __init__(
+        self,
+        scraper,
+        table: str,
+        buffer: int = 100,
+        chunk_size: int = 50,
+        max_in_flight: int = 20,
+        flush_interval: float = 5.0,
+        checkpoint: Checkpoint | None = None,
+        database=None,
+    ):
+        self.scraper = scraper
+        self.table: str = table
+        if database is None:
+            from db import Database as database
+        self.database = database  # Opens the connection of the persist stage, `NullDatabase` or a stand-in for benchmarks
+        self.chunk_size: int = chunk_size  # Records per DB transaction
+        self.max_in_flight: int = max_in_flight  # GPT extractions waiting in the enrich stage
+        self.flush_interval: float = flush_interval  # Seconds without new records before a partial chunk is written
+
+        self.pages = queue.Queue(maxsize=scraper.fetcher.workers)
+        self.entries = queue.Queue(maxsize=buffer)
+        self.records = queue.Queue(maxsize=buffer)
+
+        # Only pages following each other are checkpointed, a page that failed to load stops the progress there
+        self.checkpoint: Checkpoint | None = checkpoint
+        self.next_checkpoint_page: int = scraper.current_page
+        self.page_failed: bool = False  # Some entries of the current page could not be written
+        self.failed_pages: int = 0  # Pages that could not be loaded or written
+        self.caught_up: bool = False  # Got through all pages or stopped early at the ones it already knew
+        self.owed_page: int | None = None  # What the earlier runs left undone, as the manifest had it when this run started
+
+        self.stop = threading.Event()
+        self.error: Exception | None = None
+        self.stats: dict = {"pages": 0, "entries": 0, "persisted": 0}
+
+    def run(self) -> int:
+        """Runs all stages until the pages run out or the scraper stops early. Returns the records written"""
+        start = perf_counter()
+        stages = [self.fetch_stage, self.parse_stage, self.enrich_stage, self.persist_stage]
+        threads = [
+            threading.Thread(target=stage, name=stage.__name__, daemon=True) for stage in stages
+        ]
+
+        # Saved before the first page, a run that is killed halfway still leaves its pages owed
+        if self.scraper.manifest is not None:
+            self.owed_page = self.scraper.manifest.owed_page
+            self.scraper.manifest.owe(self.scraper.current_page)
+            self.scraper.manifest.save()
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.scraper.writer.close()
+        if self.scraper.manifest is not None:
+            if self.completed:
+                self.scraper.manifest.finish_run()
+            self.scraper.manifest.save()
+        self.scraper.fetcher.print_stats()
+        self.scraper.gpt_cache.print_stats()
+        self.scraper.print_extract_stats()
+        if self.scraper.fetcher.cache is not None:
+            self.scraper.fetcher.cache.save_index()
+
+        seconds = perf_counter() - start
+        print(
+            f"[Pipeline] {self.stats['pages']} pages, {self.stats['entries']} entries, {self.stats['persisted']} written in {seconds} seconds"
+        )
+        metrics.event("pipeline", year=self.scraper.year, seconds=seconds, error=self.error, **self.stats)
+
+        if self.error is not None:
+            raise self.error
+
+        return self.stats["persisted"]
+
+    @property
+    def completed(self) -> bool:
+        """Nothing of the run is left for the next one, it was neither stopped nor lost a page"""
+        return self.caught_up and self.error is None and not self.failed_pages
+
+    def caught_up_at(self, page: int) -> bool:
+        """Stopping early at `page` is fine unless an earlier run still owes it"""
+        if self.owed_page is not None and page <= self.owed_page:
+            return False
+
+        self.caught_up = True
+        return True
+
+    def fail(self, err: Exception, inbox: queue.Queue | None):
+        """Stops the pipeline and keeps consuming `inbox` so the stages before this one can finish"""
+        print(f"[Pipeline] Error in {threading.current_thread().name}: {err}")
+        if self.error is None:
+            self.error = err
+        self.stop.set()
+
+        if inbox is not None:
+            while inbox.get() is not DONE:
+                pass
+
+    def fetch_stage(self):
+        scraper = self.scraper
+        page_urls = [
+            f"{scraper.url_articles}{page}"
+            for page in range(scraper.current_page, scraper.total_pages + 1)
+        ]
+        # A full run has to see every page, a 304 would skip the entries of the pages that did not change
+        pages = scraper.fetcher.fetch_pages(page_urls, conditional=scraper.stop_early)
+
+        try:
+            for page, (url, content) in enumerate(pages, start=scraper.current_page):
+                if self.stop.is_set():
+                    break
+                self.pages.put((page, content))
+        except Exception as err:
+            self.fail(err, None)
+        finally:
+            pages.close()
+            self.pages.put(DONE)
+
+    def parse_stage(self):
+        scraper = self.scraper
+        sync = scraper.manifest is not None and scraper.stop_early
+
+        try:
+            while (item := self.pages.get()) is not DONE:
+                # Pages still fetched after a stop are dropped
+                if self.stop.is_set():
+                    continue
+
+                page, content = item
+                scraper.current_page = page
+                print(f"[Scraper] On page {page}")
+
+                if content is None:
+                    self.failed_pages += 1
+                    continue
+
+                if content is NOT_MODIFIED:
+                    metrics.count("pages_not_modified")
+                    if scraper.stop_early and self.caught_up_at(page):
+                        print(f"[Scraper] Page {page} not modified since the last run, we stop here.")
+                        scraper.total_pages = page - 1
+                        self.stop.set()
+                    else:
+                        print(f"[Scraper] Page {page} not modified since the last run, skipping it.")
+                        self.entries.put((PAGE_DONE, page, None, None, None))
+                    continue
+
+                page_hash = content_hash(content)
+                if sync and scraper.manifest.page_matches(page, page_hash) and self.caught_up_at(page):
+                    print(f"[Scraper] Page {page} is the same as in the manifest, we stop here.")
+                    metrics.count("pages_matched")
+                    scraper.total_pages = page - 1
+                    self.stop.set()
+                    continue
+
+                page_start = perf_counter()
+                with metrics.timer("parse"):
+                    articles = parse_articles(content, scraper.parser)
+                print(f"[Scraper] Found {len(articles)} articles")
+                self.stats["pages"] += 1
+                metrics.count("pages_parsed")
+
+                new_entries = 0
+                page_articles: dict = {}  # post_id -> article hash
+                for article in articles:
+                    post_id = str(article.get("id", "N/A"))
+                    article_hash = content_hash(str(article))
+                    page_articles[post_id] = article_hash
+
+                    # Unchanged since it was written to the DB, no need to parse it again
+                    if sync and scraper.manifest.article_matches(post_id, article_hash):
+                        metrics.count("articles_matched")
+                        continue
+
+                    parsed = scraper.parse_article(article)
+                    if parsed is not None:
+                        new_entries += 1
+                        self.entries.put(parsed)
+                self.stats["entries"] += new_entries
+                metrics.event(
+                    "page",
+                    year=scraper.year,
+                    page=page,
+                    articles=len(articles),
+                    new_entries=new_entries,
+                    seconds=perf_counter() - page_start,
+                )
+
+                last_post_id = str(articles[-1].get("id", "N/A")) if articles else None
+                self.entries.put((PAGE_DONE, page, last_post_id, page_hash, page_articles))
+
+                if scraper.stop_early and new_entries == 0 and self.caught_up_at(page):
+                    print(f"[Scraper] No new entries on page {page} so we stop here.")
+                    scraper.total_pages = page
+                    self.stop.set()
+
+            # The pages ran out without a stop
+            if not self.stop.is_set():
+                self.caught_up = True
+        except Exception as err:
+            self.fail(err, self.pages)
+        finally:
+            self.entries.put(DONE)
+
+    def enrich_stage(self):
+        scraper = self.scraper
+        in_flight = deque()  # (article or page marker, future or None) in the order they came
+        extractions = 0  # Futures in `in_flight`
+
+        def finish():
+            nonlocal extractions
+            item, future = in_flight.popleft()
+            if future is not None:
+                scraper.finish_gpt(item, future)
+                extractions -= 1
+            self.records.put(item)
+
+        try:
+            while (item := self.entries.get()) is not DONE:
+                if item[0] is PAGE_DONE:
+                    future = None
+                else:
+                    article, needs_gpt = item
+                    item = article
+                    future = scraper.start_gpt(article) if needs_gpt else None
+
+                # Nothing to wait for, straight on
+                if future is None and not in_flight:
+                    self.records.put(item)
+                    continue
+
+                # Page markers and the articles after them wait behind the extractions of earlier entries,
+                # so every page is committed before its marker and nothing of the next page slips in
+                in_flight.append((item, future))
+                if future is not None:
+                    extractions += 1
+
+                # Hand over finished extractions in order and wait once too many are in flight
+                while in_flight and (
+                    in_flight[0][1] is None
+                    or in_flight[0][1].done()
+                    or extractions >= self.max_in_flight
+                ):
+                    finish()
+
+            while in_flight:
+                finish()
+        except Exception as err:
+            self.fail(err, self.entries)
+        finally:
+            scraper.close_gpt_pool()
+            self.records.put(DONE)
+
+    def persist_stage(self):
+        db = None
+        chunk: list = []
+
+        try:
+            db = self.database()
+            while True:
+                try:
+                    item = self.records.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    self.persist(db, chunk)
+                    chunk = []
+                    continue
+
+                if item is DONE:
+                    break
+
+                # Everything but the articles is a page marker
+                if isinstance(item, tuple):
+                    self.persist(db, chunk)
+                    chunk = []
+                    self.page_done(*item[1:])
+                    continue
+
+                chunk.append(item)
+                if len(chunk) >= self.chunk_size:
+                    self.persist(db, chunk)
+                    chunk = []
+
+            self.persist(db, chunk)
+        except Exception as err:
+            self.fail(err, self.records)
+        finally:
+            if db is not None:
+                db.close_connection()
+
+    def page_done(self, page: int, post_id: str | None, page_hash: str | None, articles: dict | None):
+        """All entries of `page` went through the persist stage"""
+        page_failed, self.page_failed = self.page_failed, False
+        if page_failed:
+            self.failed_pages += 1
+
+        # A page with entries that failed to write stays out of the manifest so the next run parses it again
+        if self.scraper.manifest is not None:
+            if page_hash is not None and not page_failed:
+                self.scraper.manifest.page_done(page, page_hash, articles)
+            self.scraper.manifest.owe(page + 1)
+
+        if self.checkpoint is None:
+            return
+
+        # The GPT work of the page is through the enrich stage by now, it goes with the page.
+        # A failed page holds the checkpoint back, the resumed run starts over from the page before it
+        gpt_work = dict(self.scraper.gpt_batch), dict(self.scraper.gpt_failed)
+        if page_failed or page != self.next_checkpoint_page:
+            self.checkpoint.gpt_work(*gpt_work)
+            return
+
+        self.checkpoint.page_done(self.scraper.year, page, post_id, *gpt_work)
+        self.next_checkpoint_page = page + 1
+
+    def persist(self, db, chunk: list[Article]):
+        if not chunk:
+            return
+
+        updated_keys = [article.post_id for article in chunk if article.update_entry]
+        if updated_keys:
+            db.move_data(updated_keys, self.table)
+
+        written = db.bulk_upsert(self.table, [article.to_row() for article in chunk], len(chunk))
+        self.stats["persisted"] += written
+        if written < len(chunk):
+            self.page_failed = True
+        else:
+            # Keep the index current for a resident scraper that runs again
+            for article in chunk:
+                self.scraper.existing_data[article.post_id] = (summary_hash(article.summary), datetime.now())
+
+        # The places are what the outage lookups read, an entry without them is not done
+        places = [place for article in chunk for place in article_places(article)]
+        if db.replace_places(self.table, [article.post_id for article in chunk], places, len(chunk)) < len(places):
+            self.page_failed = True
+
+        for article in chunk:
+            self.scraper.writer.write(self.scraper.year, "article", article.post_id, article.to_dict())
+
+        print(f"[DB] Committed {written} of {len(chunk)} entries")
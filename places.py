@@ -0,0 +1,62 @@
+"""Rows of the `{table}_places` tables, one per town or village of an article with its parsed period.
+`python places.py backfill` fills the table for the articles that were stored before it existed"""
+
+import sys
+from datetime import date
+from time import perf_counter
+from gazetteer import place_id
+from period import parse_period
+from record import Article, table_name
+
+
+place_length = 128  # Size of the `place` column
+
+
+def split_places(location: str | None) -> list:
+    """ "гр. Пазарджик, с. Мало Конаре" -> ["гр. Пазарджик", "с. Мало Конаре"] without duplicates"""
+    if not location:
+        return []
+
+    places = (" ".join(place.split())[:place_length] for place in location.split(","))
+    return list(dict.fromkeys(place for place in places if place))
+
+
+def place_rows(post_id: str, location: str | None, period: str | None, article_date: date | None) -> list:
+    """An article as parameters in `db.place_columns` order, places outside the gazetteer have no `place_id`"""
+    start, end = parse_period(period, article_date) if article_date else (None, None)
+    return [(post_id, place, place_id(place), article_date, start, end) for place in split_places(location)]
+
+
+def article_places(article: Article) -> list:
+    return place_rows(article.post_id, article.location, article.period, article.article_date)
+
+
+def backfill(table: str, chunk_size: int = 500) -> int:
+    """Rebuilds the places of every article in `table`. Returns the number of places written"""
+    from db import Database
+
+    start = perf_counter()
+    keys: list = []
+    rows: list = []
+
+    with Database() as db:
+        for post_id, location, period, article_date in db.get_locations(table):
+            keys.append(post_id)
+            rows.extend(place_rows(post_id, location, period, article_date))
+
+        written = db.replace_places(table, keys, rows, chunk_size)
+
+    print(
+        f"[Places] Wrote {written} places of {len(keys)} entries in {perf_counter() - start} seconds"
+    )
+    return written
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "backfill":
+        from ai import model
+
+        backfill(sys.argv[2] if len(sys.argv) >= 3 else table_name(model))
+    else:
+        print("Usage: python places.py backfill [table]")
+        sys.exit(1)
@@ -0,0 +1,165 @@
+"""The scraped article, shared by the scraper, the JSON Lines dumper and the DB writes.
+Field names follow the columns of the article tables"""
+
+import hashlib, sys
+from dataclasses import dataclass
+from datetime import date, datetime
+from period import parse_period
+
+
+# Column order of the article tables, shared by the bulk writes
+article_columns: tuple = (
+    "post_id",
+    "title",
+    "location",
+    "period",
+    "author",
+    "summary",
+    "category",
+    "ai_extract",
+    "page",
+    "total_pages",
+    "comments",
+    "article_date",
+    "period_start",
+    "period_end",
+)
+
+
+def table_name(model: str) -> str:
+    """Articles are stored in a table named after the GPT model, "gpt-4o-mini" -> "vik_gpt_4o_mini" """
+    return f"vik_{model.replace('-', '_')}"
+
+
+def summary_hash(summary: str) -> str:
+    """Same digest as MySQL's `SHA1(summary)` so only hashes need to leave the DB"""
+    return hashlib.sha1(summary.encode("utf-8")).hexdigest()
+
+
+def intern(text: str | None) -> str | None:
+    """Authors, categories, places and periods repeat across thousands of articles, keep one copy of each"""
+    return sys.intern(text) if text is not None else None
+
+
+@dataclass(slots=True)
+class Article:
+    """### One article of the site with its extracted place and period"""
+
+    post_id: str
+    title: str
+    location: str | None
+    period: str | None
+    author: str
+    summary: str
+    category: str
+    article_date: date
+    page: int
+    total_pages: int
+    comments: str | None = None
+    ai_extract: bool = False
+    gpt_data: dict | None = None  # Last GPT response, only kept for the dump
+    update_entry: bool = False  # Already in the DB with a different summary
+
+    def __post_init__(self):
+        self.author = intern(self.author)
+        self.category = intern(self.category)
+        self.location = intern(self.location)
+        self.period = intern(self.period)
+
+    @property
+    def date_text(self) -> str:
+        """The article date as "dd.MM.YYYY", the form used in the GPT prompt and cache"""
+        return self.article_date.strftime("%d.%m.%Y")
+
+    def set_extraction(self, location: str | None, period: str | None):
+        self.location = intern(location)
+        self.period = intern(period)
+
+    @property
+    def period_range(self) -> tuple[datetime | None, datetime | None]:
+        """Start and end of the period, see `period.parse_period`"""
+        return parse_period(self.period, self.article_date)
+
+    def to_row(self) -> tuple:
+        """Parameters in `article_columns` order"""
+        return (
+            self.post_id,
+            self.title,
+            self.location,
+            self.period,
+            self.author,
+            self.summary,
+            self.category,
+            1 if self.ai_extract else 0,
+            self.page,
+            self.total_pages,
+            self.comments,
+            self.article_date,
+            *self.period_range,
+        )
+
+    def to_dict(self) -> dict:
+        """JSON ready data for the dumper"""
+        return {
+            "post_id": self.post_id,
+            "title": self.title,
+            "location": self.location,
+            "period": self.period,
+            "author": self.author,
+            "summary": self.summary,
+            "category": self.category,
+            "article_date": self.article_date.isoformat(),
+            "page": self.page,
+            "total_pages": self.total_pages,
+            "comments": self.comments,
+            "ai_extract": self.ai_extract,
+            "gpt_data": self.gpt_data,
+            "update_entry": self.update_entry,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Article":
+        """Reads back `to_dict`, also the data of older dumps with `place`, `date` and `current_page`"""
+        if "article_date" in data:
+            article_date = date.fromisoformat(data["article_date"])
+        else:
+            article_date = datetime.strptime(data["date"], "%d.%m.%Y").date()
+
+        return cls(
+            post_id=data["post_id"],
+            title=data["title"],
+            location=data["location"] if "location" in data else data.get("place"),
+            period=data["period"],
+            author=data["author"],
+            summary=data["summary"],
+            category=data["category"],
+            article_date=article_date,
+            page=data["page"] if "page" in data else data["current_page"],
+            total_pages=data["total_pages"],
+            comments=data.get("comments"),
+            ai_extract=bool(data.get("ai_extract")),
+            gpt_data=data.get("gpt_data"),
+            update_entry=bool(data.get("update_entry")),
+        )
+
+    @classmethod
+    def from_row(cls, row: dict) -> "Article":
+        """An article from a dict cursor row of the article tables"""
+        article_date = row["article_date"]
+        if isinstance(article_date, datetime):
+            article_date = article_date.date()
+
+        return cls(
+            post_id=row["post_id"],
+            title=row["title"],
+            location=row["location"],
+            period=row["period"],
+            author=row["author"],
+            summary=row["summary"],
+            category=row["category"],
+            article_date=article_date,
+            page=row["page"],
+            total_pages=row["total_pages"],
+            comments=row["comments"],
+            ai_extract=bool(row["ai_extract"]),
+        )
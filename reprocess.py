@@ -0,0 +1,292 @@
+"""Offline reprocessing of the stored articles, after the RegEx, the rules or the prompt changed.
+The summaries are streamed from the DB or from the JSON Lines dumps, run through the current extractors
+in worker processes and compared with the stored place and period, only the articles that changed are written.
+Nothing is fetched, summaries that only GPT can tell are looked up in the GPT cache and keep their stored values
+when they are not there, `gpt_mode="batch"` also writes those to a Batch API file"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import chain
+from time import perf_counter
+from ai import model, prompt_version
+from article_parser import resolve_notice
+from cache import ExtractionCache
+from gazetteer import canonical_location
+from metrics import metrics
+from period import parse_period
+from places import place_rows
+from record import Article, table_name
+from stream import JsonlWriter, read_dump
+
+
+logs_path: str = os.path.dirname(__file__)
+
+
+def resolve_chunk(chunk: list) -> list:
+    """Runs in the workers, `(post_id, summary, article_date)` -> `(post_id, location, period, method)`"""
+    return [(post_id, *resolve_notice(summary, article_date)) for post_id, summary, article_date in chunk]
+
+
+def stored_value(text: str | None) -> str | None:
+    return (text.strip() or None) if text else None
+
+
+class Reprocessor:
+    """### Re-extracts stored articles and keeps the ones whose place or period changed.
+    Articles are `(post_id, summary, location, period, ai_extract, article_date)` tuples as `Database.get_summaries` yields them,
+    `resolve` returns the changes as `(post_id, location, period, ai_extract, article_date)`.
+    `keep_gpt` leaves the articles GPT extracted alone even when the RegEx or the rules resolve them now"""
+
+    def __init__(
+        self,
+        processes: int | None = None,
+        chunk_size: int = 500,
+        gpt_mode: str = "cache",
+        keep_gpt: bool = False,
+        gpt_cache: ExtractionCache | None = None,
+    ):
+        self.processes: int = processes or os.cpu_count() or 1
+        self.chunk_size: int = chunk_size
+        self.gpt_mode: str = gpt_mode
+        self.keep_gpt: bool = keep_gpt
+        self.gpt_cache: ExtractionCache = gpt_cache or ExtractionCache(
+            f"{logs_path}/logs/gpt/extractions.sqlite"
+        )
+        self.gpt_batch: dict = {}  # post_id -> (summary, date) left for the Batch API
+        self.executor: ProcessPoolExecutor | None = None
+
+        self.stats: dict = {
+            "articles": 0,
+            "regex": 0,
+            "rules": 0,
+            "gpt": 0,
+            "gpt_cached": 0,
+            "gpt_missing": 0,
+            "changed": 0,
+        }
+
+    def __enter__(self):
+        if self.processes > 1:
+            self.executor = ProcessPoolExecutor(max_workers=self.processes)
+
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def resolve(self, articles: list) -> list:
+        chunks = [
+            [(item[0], item[1], item[5].strftime("%d.%m.%Y")) for item in articles[start : start + self.chunk_size]]
+            for start in range(0, len(articles), self.chunk_size)
+        ]
+
+        # A single chunk is not worth the trip to a worker
+        if self.executor is not None and len(chunks) > 1:
+            results = list(chain.from_iterable(self.executor.map(resolve_chunk, chunks)))
+        else:
+            results = list(chain.from_iterable(map(resolve_chunk, chunks)))
+
+        changes = []
+        for (post_id, summary, old_location, old_period, old_ai, article_date), (_, location, period, method) in zip(
+            articles, results
+        ):
+            self.stats["articles"] += 1
+            self.stats[method] += 1
+            ai_extract = False
+
+            if method == "gpt":
+                date_text = article_date.strftime("%d.%m.%Y")
+                gpt_response = self.gpt_cache.get(model, prompt_version, summary, date_text)
+                if gpt_response is not None:
+                    location = canonical_location(gpt_response["places"])
+                    period = gpt_response["period"].strip()
+                    ai_extract = True
+                    self.stats["gpt_cached"] += 1
+                else:
+                    self.stats["gpt_missing"] += 1
+                    if self.gpt_mode == "batch":
+                        self.gpt_batch[post_id] = (summary, date_text)
+                    if old_ai:
+                        continue
+            elif old_ai and self.keep_gpt:
+                continue
+
+            if (stored_value(location), stored_value(period), ai_extract) == (
+                stored_value(old_location),
+                stored_value(old_period),
+                bool(old_ai),
+            ):
+                continue
+
+            print(f"[Reprocess] {post_id} Place Old: {old_location} | New: {location}")
+            print(f"[Reprocess] {post_id} Period Old: {old_period} | New: {period}")
+            changes.append((post_id, stored_value(location), stored_value(period), ai_extract, article_date))
+
+        self.stats["changed"] += len(changes)
+        metrics.count("reprocess_articles", len(articles))
+        metrics.count("reprocess_changed", len(changes))
+
+        return changes
+
+    def write_db(self, db, table: str, changes: list) -> int:
+        """Archives the current rows to the edited table, then writes the new values and their places"""
+        if not changes:
+            return 0
+
+        keys = [change[0] for change in changes]
+        moved = db.move_data(keys, table, self.chunk_size)
+        print(f"[DB] Moved {moved} of {len(keys)} entries to edited table")
+
+        written = 0
+        for ai_extract in (False, True):
+            rows = [
+                (location, period, *parse_period(period, article_date), post_id)
+                for post_id, location, period, ai, article_date in changes
+                if ai == ai_extract
+            ]
+            if rows:
+                written += db.update_extractions(table, rows, self.chunk_size, ai_extract=ai_extract)
+
+        db.replace_places(
+            table,
+            keys,
+            [
+                place
+                for post_id, location, period, _, article_date in changes
+                for place in place_rows(post_id, location, period, article_date)
+            ],
+            self.chunk_size,
+        )
+
+        return written
+
+    def write_batch(self) -> str | None:
+        if not self.gpt_batch:
+            return None
+
+        from batch import write_batch_file
+
+        batch_file = f"{logs_path}/logs/gpt/batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+        write_batch_file(self.gpt_batch, batch_file)
+        print(f"[Reprocess] Run `python batch.py {batch_file}` to extract {len(self.gpt_batch)} entries with GPT")
+
+        return batch_file
+
+    def print_stats(self, seconds: float):
+        articles = self.stats["articles"]
+        print(
+            f"[Reprocess] {self.stats['changed']} of {articles} articles changed in {seconds:.2f} seconds "
+            f"({articles / max(seconds, 1e-9):.0f} articles/s, RegEx: {self.stats['regex']}, rules: {self.stats['rules']}, "
+            f"GPT: {self.stats['gpt']} of which {self.stats['gpt_cached']} cached and {self.stats['gpt_missing']} missing)"
+        )
+
+
+def reprocess_db(
+    years: list | range | None = None,
+    dry_run: bool = False,
+    table: str | None = None,
+    database=None,
+    **options,
+) -> dict:
+    """Reprocesses the articles of `years` in the DB, all of them by default, one year at a time.
+    `dry_run` only prints what would change, the other `options` go to `Reprocessor`"""
+    if database is None:
+        from db import Database as database
+
+    start_total = perf_counter()
+    table = table or table_name(model)
+    written = 0
+
+    with Reprocessor(**options) as reprocessor, database() as db:
+        # Only one year of summaries is in memory at a time
+        if years is None:
+            years = db.get_years(table)
+            print(f"[Reprocess] {table} has articles of {years}")
+
+        for year in years:
+            articles = []
+            for post_id, summary, location, period, ai_extract, article_date in db.get_summaries(table, year):
+                if isinstance(article_date, datetime):
+                    article_date = article_date.date()
+                articles.append((post_id, summary, location, period, ai_extract, article_date))
+            print(f"[Reprocess] Got {len(articles)} entries of {year} from {table}")
+
+            changes = reprocessor.resolve(articles)
+            if not dry_run:
+                written += reprocessor.write_db(db, table, changes)
+
+        if not dry_run:
+            reprocessor.write_batch()
+
+    seconds = perf_counter() - start_total
+    reprocessor.print_stats(seconds)
+    metrics.flush("reprocess", source="db", years=years, seconds=seconds, written=written)
+
+    return {**reprocessor.stats, "written": written}
+
+
+def reprocess_files(
+    file_names: list,
+    dry_run: bool = False,
+    write_db: bool = False,
+    table: str | None = None,
+    output: str = f"{logs_path}/logs/data",
+    database=None,
+    **options,
+) -> dict:
+    """Reprocesses the last article records of JSON Lines dumps and of the older `scraped_data_{year}_full.json` ones.
+    The changed articles are appended to the JSON Lines dumps in `output`, so they win over the old lines,
+    and with `write_db` they are also written to the DB"""
+    start_total = perf_counter()
+    table = table or table_name(model)
+
+    latest: dict = {}  # post_id -> (year, Article)
+    for file_name in file_names:
+        for record in read_dump(file_name):
+            if record.get("type") != "article":
+                continue
+
+            try:
+                latest[record["id"]] = (record["year"], Article.from_dict({"post_id": record["id"], **record["data"]}))
+            except (KeyError, TypeError, ValueError) as err:
+                print(f"[Reprocess] Skipping {record.get('id')} of {file_name}, it is missing {err}")
+
+    print(f"[Reprocess] Got {len(latest)} entries from {len(file_names)} files")
+    articles = [
+        (post_id, item.summary, item.location, item.period, item.ai_extract, item.article_date)
+        for post_id, (_, item) in latest.items()
+    ]
+
+    written = 0
+    with Reprocessor(**options) as reprocessor:
+        changes = reprocessor.resolve(articles)
+
+        if not dry_run and changes:
+            writer = JsonlWriter(output)
+            for post_id, location, period, ai_extract, _ in changes:
+                year, item = latest[post_id]
+                item.set_extraction(location, period)
+                item.ai_extract = ai_extract
+                if not ai_extract:
+                    item.gpt_data = None
+                writer.write(year, "article", post_id, item.to_dict())
+            writer.close()
+
+            if write_db:
+                if database is None:
+                    from db import Database as database
+
+                with database() as db:
+                    written = reprocessor.write_db(db, table, changes)
+
+        if not dry_run:
+            reprocessor.write_batch()
+
+    seconds = perf_counter() - start_total
+    reprocessor.print_stats(seconds)
+    metrics.flush("reprocess", source="files", files=file_names, seconds=seconds, written=written)
+
+    return {**reprocessor.stats, "written": written}
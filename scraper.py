@@ -1,10 +1,25 @@
-import json, re, requests, os, sys
-from datetime import datetime
+import os
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+from datetime import date, datetime
 from functools import wraps
 from time import perf_counter
-from bs4 import BeautifulSoup
-from db import Database
-from ai import OpenAIExtractor
+from ai import OpenAIExtractor, ExtractionPool, model, prompt_version
+from fetcher import Fetcher
+from cache import PageCache, ExtractionCache
+from batch import write_batch_file
+from stream import JsonlWriter
+from pipeline import NullDatabase, Pipeline
+from gazetteer import canonical_location
+from record import Article, summary_hash, table_name
+from checkpoint import Checkpoint
+from manifest import Manifest
+from metrics import metrics
+from article_parser import (
+    parse_nav_links,
+    extract_fields,
+    resolve_notice,
+)
 
 
 # Mapping of Bulgarian month abbreviations to their numerical equivalents
@@ -23,7 +38,6 @@ bulgarian_months = {
     "дек.": "12",
 }
 
-existing_data: dict = {}
 logs_path: str = os.path.dirname(__file__)
 
 
@@ -43,68 +57,254 @@ def memoize(func):
     return wrapper
 
 
-def full_export():
-    """Full scrapes 2020 to 2024. Prints redirected to an output file"""
+def page_cache(replay: bool = False, ttl: float | None = 6 * 60 * 60) -> PageCache:
+    """Raw listing pages under `logs/cache`, `replay` serves only what is already there"""
+    return PageCache(f"{logs_path}/logs/cache", ttl=ttl, replay=replay)
+
+
+def full_export(
+    years: list | range | None = None,
+    cache: PageCache | None = None,
+    gpt_mode: str = "sync",
+    resume: bool = True,
+    processes: int = 1,
+):
+    """Full scrapes the given years, the current one by default. Prints of every year go to its own output file.
+    Progress is checkpointed after every page, an interrupted export continues where it stopped unless `resume` is off.
+    With `processes` above 1 the years are exported in parallel, one worker process per year.
+    Pass a `page_cache()` to reuse downloaded pages, `page_cache(replay=True)` works offline.
+    With `gpt_mode="batch"` the GPT extractions are written to a Batch API file for `python batch.py <file>`"""
     start_total = perf_counter()
+    years = list(years) if years is not None else [datetime.now().year]
+
+    # Tables are named after the GPT model
+    table = table_name(model)
+
+    results = []
+    if processes > 1 and len(years) > 1:
+        # Every worker has its own DB connection, fetcher and checkpoint, only the stats come back
+        with ProcessPoolExecutor(max_workers=min(processes, len(years))) as executor:
+            futures = {
+                executor.submit(export_year_process, year, table, cache, gpt_mode, resume): year
+                for year in years
+            }
 
-    years = [2020, 2021, 2022, 2023, 2024]
-    # years = [2020]
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                    metrics.merge(result.pop("metrics"))
+                except Exception as err:
+                    result = {"year": futures[future], "done": False, "error": str(err)}
+                print_year_result(result)
+                results.append(result)
+    else:
+        for year in years:
+            try:
+                result = export_year(year, table, cache, gpt_mode, resume)
+            except Exception as err:
+                result = {"year": year, "done": False, "error": str(err)}
+            print_year_result(result)
+            results.append(result)
+
+    totals = {
+        key: sum(result.get(key, 0) for result in results)
+        for key in ("pages", "entries", "persisted")
+    }
+    print(
+        f"[Main] {totals['pages']} pages, {totals['entries']} entries, {totals['persisted']} written for {len(years)} years"
+    )
+    metrics.print_stats()
+    metrics.flush("full_export", years=years, seconds=perf_counter() - start_total, **totals)
+
+    unfinished_years = sorted(result["year"] for result in results if not result["done"])
+    if unfinished_years:
+        print(f"[Main] Could not export {unfinished_years}, run it again to resume them")
+        return
+
+    # The extractions that failed on every try go to the Batch API with the rest
+    checkpoints = [year_checkpoint(year) for year in years]
+    gpt_batch: dict = {}
+    for checkpoint in checkpoints:
+        gpt_batch.update(checkpoint.gpt_pending())
+        gpt_batch.update(checkpoint.gpt_failed())
+
+    if gpt_batch:
+        batch_file = f"{logs_path}/logs/gpt/batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+        write_batch_file(gpt_batch, batch_file)
+        print(f"[Main] Run `python batch.py {batch_file}` to extract {len(gpt_batch)} entries with GPT")
+
+    # Everything is done, the next export starts over
+    for checkpoint in checkpoints:
+        checkpoint.clear()
 
-    for year in years:
-        year_start = perf_counter()
-        # Remove the file if it already exists
-        if os.path.exists(f"{logs_path}/logs/console/output_{year}.txt"):
-            os.remove(f"{logs_path}/logs/console/output_{year}.txt")
+    end_total = perf_counter()
+    print(f"[Main] Finished the full export in {end_total - start_total} seconds")
 
-        # Redirect stdout to a file
-        with open(
-            f"{logs_path}/logs/console/output_{year}.txt", "w", encoding="utf-8"
-        ) as file:
-            sys.stdout = file
 
-            # Initiate to get the model name which is used for table names
-            gpt = OpenAIExtractor()
+def export_year_process(*args) -> dict:
+    """`export_year` in a worker process, the metrics of that year go back with the result"""
+    metrics.reset()
+    result = export_year(*args)
+    result["metrics"] = metrics.snapshot()
 
-            # Load the data we will use for checking existing entries
-            db = Database()
-            get_query = f"SELECT * FROM vik_{gpt.model.replace('-', '_')};"
-            existing_data = db.get_data(get_query)
+    return result
 
-            db.close_connection()
 
-            if existing_data is not False:
-                print(f"[Main] {len(existing_data)} entries loaded")
+def year_checkpoint(year: int) -> Checkpoint:
+    return Checkpoint(f"{logs_path}/logs/data/full_export_checkpoint_{year}.json")
 
-            # Start the scraping process
-            x = Scraper(year=year, pages=0)
 
-            if x.total_pages > 0:
-                scraped = x.web_scraper()
-            else:
-                print(f"[Main] Got no pages")
+def year_manifest(year: int) -> Manifest:
+    return Manifest(f"{logs_path}/logs/data/manifest_{year}.json")
 
-            input_to_db(scraped)
 
-            year_end = perf_counter()
-            print(
-                f"[Main] Finished the process for {year} in {year_end - year_start} seconds"
-            )
+def print_year_result(result: dict):
+    if result.get("error"):
+        print(f"[Main] {result['year']} failed: {result['error']}")
+    elif result.get("skipped"):
+        print(f"[Main] {result['year']} was already exported, skipping it")
+    elif result.get("incomplete"):
+        print(f"[Main] {result['year']} has pages that failed, run it again to resume it")
+    elif not result["done"]:
+        print(f"[Main] {result['year']} got no pages")
+    else:
+        print(
+            f"[Main] Finished {result['year']} with {result['pages']} pages and {result['persisted']} entries in {result['seconds']} seconds"
+        )
 
-            # Restore stdout to default (console)
-            sys.stdout = sys.__stdout__
 
-    end_total = perf_counter()
-    print(f"[Main] Finished the full export in {end_total - start_total} seconds")
+def export_year(
+    year: int,
+    table: str,
+    cache: PageCache | None = None,
+    gpt_mode: str = "sync",
+    resume: bool = True,
+) -> dict:
+    """Exports one year with its own DB connection, fetcher and checkpoint, its prints go to `logs/console/output_{year}.txt`.
+    Runs in a worker process for parallel exports, so it only returns picklable stats"""
+    year_start = perf_counter()
+    result = {"year": year, "done": False, "pages": 0, "entries": 0, "persisted": 0}
+
+    checkpoint = year_checkpoint(year)
+    if not resume:
+        checkpoint.clear()
+
+    if checkpoint.year_done(year):
+        result.update(done=True, skipped=True)
+        return result
+
+    start_page = checkpoint.resume_page(year)
+
+    # Keep the output of the interrupted run when resuming
+    with open(
+        f"{logs_path}/logs/console/output_{year}.txt",
+        "a" if start_page > 1 else "w",
+        encoding="utf-8",
+    ) as file, redirect_stdout(file):
+        from db import Database
+
+        # Load the hashes we will use for checking existing entries of this year
+        with Database() as db:
+            existing_data = db.get_index(table, year)
+
+        if existing_data is not False:
+            print(f"[Main] {len(existing_data)} entries loaded")
+
+        # Start the scraping process, a full export goes through every page even if nothing is new on it
+        x = Scraper(
+            year=year,
+            pages=0,
+            cache=cache,
+            existing_data=existing_data or {},
+            stop_early=False,
+            gpt_mode=gpt_mode,
+            manifest=year_manifest(year),
+        )
+
+        # Stream the pages into the DB as they are scraped
+        if x.total_pages > 0:
+            if start_page > 1:
+                print(f"[Main] Resuming {year} from page {start_page}")
+                x.current_page = start_page
+
+            # The entries of the failed extractions are in the DB already, the resumed run would skip them
+            failed = checkpoint.gpt_failed()
+            if failed:
+                print(f"[Main] Retrying {len(failed)} GPT extractions that failed before")
+                checkpoint.gpt_retried(x.retry_gpt(failed, table))
+
+            pipeline = Pipeline(x, table, checkpoint=checkpoint)
+            pipeline.run()
+            result.update(pipeline.stats)
+
+            # A page that could not be loaded or written keeps the year open, the next run resumes before it
+            if pipeline.completed:
+                x.fetcher.save_validators()
+                checkpoint.year_finished(year, x.gpt_batch, x.gpt_failed)
+                result["done"] = True
+            else:
+                checkpoint.gpt_work(x.gpt_batch, x.gpt_failed)
+                result["incomplete"] = True
+                print(
+                    f"[Main] {pipeline.failed_pages} pages of {year} failed, the next run resumes from page {checkpoint.resume_page(year)}"
+                )
+        else:
+            print("[Main] Got no pages")
+
+        result["seconds"] = perf_counter() - year_start
+        print(f"[Main] Finished the process for {year} in {result['seconds']} seconds")
+
+    return result
 
 
 class Scraper:
-    def __init__(self, year: int, pages: int):
-        """Sending 0 or less as `pages` will scrape the whole year provided"""
+    def __init__(
+        self,
+        year: int,
+        pages: int,
+        workers: int = 4,
+        delay: float = 0.5,
+        cache: PageCache | None = None,
+        parser: str = "html.parser",
+        existing_data: dict | None = None,
+        stop_early: bool = True,
+        gpt_cache: ExtractionCache | None = None,
+        gpt_mode: str = "sync",
+        manifest: Manifest | None = None,
+    ):
+        """Sending 0 or less as `pages` will scrape the whole year provided.
+        `workers` pages are fetched at once with at least `delay` seconds between requests.
+        `parser` can be `article_parser.fast_parser` to use lxml when it is installed.
+        `existing_data` is the `Database.get_index` of the year, with `stop_early` we stop at the first page without new entries.
+        `gpt_mode="batch"` collects the articles that need GPT in `gpt_batch` instead of calling the API for each one.
+        A `manifest` of the year records every committed page, with `stop_early` unchanged articles are not parsed
+        and the run stops at the first page that matches it
+        """
         self.url: str = f"https://vikpz.com/{year}/"
         self.url_articles: str = f"https://vikpz.com/{year}/page/"
         self.year: int = year
-        self.place_pattern = r"(гр\.|с\.|град |село |с . )\s?(.*?)(?= в |,| на | до | за | от |\W |$)"  # RegEx for getting the town/village of the accident
-        self.period_pattern_check = r"""(\d*:\d* - \d*:\d*)"""
+        self.parser: str = parser
+        self.existing_data: dict = existing_data or {}  # post_id -> (summary hash, date_updated)
+        self.stop_early: bool = stop_early
+        self.manifest: Manifest | None = manifest
+
+        # GPT extractions of summaries we have already sent
+        self.gpt_cache: ExtractionCache = gpt_cache or ExtractionCache(
+            f"{logs_path}/logs/gpt/extractions.sqlite"
+        )
+        self.gpt_mode: str = gpt_mode
+        self.gpt_batch: dict = {}  # post_id -> (summary, date) left for the Batch API
+        self.gpt_failed: dict = {}  # post_id -> (summary, date) of the extractions that failed, kept with their RegEx values
+
+        # One extractor for the whole run, its pool is only started once something needs GPT
+        self.gpt = OpenAIExtractor()
+        self.gpt_pool: ExtractionPool | None = None
+
+        # Every record is appended here as soon as it is produced
+        self.writer = JsonlWriter(f"{logs_path}/logs/data")
+
+        # How the place and period of every new article were resolved
+        self.extract_stats: dict = {"articles": 0, "regex": 0, "rules": 0, "gpt": 0}
 
         # Pages Init
         self.current_page: int = 1
@@ -112,22 +312,35 @@ class Scraper:
             pages  # Assign the passed pages variable - use 0 to get all pages
         )
 
-        # Scraped Data Init
-        self.scraped_data: dict = {}
+        # Fetch Init
+        self.fetcher = Fetcher(
+            workers=workers,
+            delay=delay,
+            validators_file=f"{logs_path}/logs/data/validators_{year}.json",
+            cache=cache,
+        )
 
         # Start the scraping by getting all the pages for the year that has been passed
         if pages <= 0:
             self.get_pages()
 
+    def new_run(self):
+        """Clears what the last run left behind and reloads the page count of the year,
+        a resident scraper keeps its connections, caches and index warm between runs"""
+        self.current_page = 1
+        self.total_pages = 0
+        self.gpt_batch = {}
+        self.gpt_failed = {}
+        self.extract_stats = {"articles": 0, "regex": 0, "rules": 0, "gpt": 0}
+
+        self.get_pages()
+
     def get_pages(self) -> dict:
         # Load the page
-        response = requests.get(self.url)
-        if response.status_code == 200:
-            # Parse the HTML content
-            soup = BeautifulSoup(response.content, "html.parser")
-
+        content = self.fetcher.fetch(self.url, conditional=False)
+        if content is not None:
             # Get navigation links data (next page)
-            nav_links = soup.find(class_="nav-links")
+            nav_links = parse_nav_links(content, self.parser)
 
             if nav_links:
                 # Extract the current page number
@@ -166,307 +379,248 @@ class Scraper:
 
                 return None
         else:
-            print(f"[{response.status_code}] Could not reach website {self.url}")
-
             return None
 
-    def web_scraper(self) -> dict:
-        scraper_start_timer = perf_counter()
-
-        # Loop through all the pages
-        # while self.current_page <= 1:
-        while self.current_page <= self.total_pages:
-            article_start_timer = perf_counter()
-
-            # URL of the page we are scraping
-            url = f"{self.url_articles}{self.current_page}"
-            print(f"[Scraper] On page {self.current_page}")
-
-            # Load the page
-            response = requests.get(url)
-
-            if response.status_code == 200:
-                # Parse the HTML content
-                soup = BeautifulSoup(response.content, "html.parser")
+    def parse_article(self, article) -> tuple[Article, bool] | None:
+        """Builds the entry of a new or changed article with its RegEx or rule-based place and period.
+        Returns `(entry, needs_gpt)` or `None` if the article is already in the DB unchanged"""
+        with metrics.timer("extract"):
+            return self.extract_article(article)
 
-                # Find all article tags
-                articles = soup.find_all("article")
-                print(f"[Scraper] Found {len(articles)} articles")
+    def extract_article(self, article) -> tuple[Article, bool] | None:
+        update_entry = False
 
-                self.scraped_data = self.article_looper(articles)
-
-                article_end_timer = perf_counter()
-
-                if len(self.scraped_data) < 1:
-                    print(
-                        f"[Scraper] Finished with page {self.current_page - 1} in {article_end_timer - article_start_timer} seconds, no new entries found so we stop here."
-                    )
-                    self.total_pages = self.current_page - 1
-                    break
+        # Walk the article once for all of its fields
+        fields = extract_fields(article)
+        article_id: str = fields["id"]
+        entry_summary: str = fields["summary"]
 
+        # Skip the article if it already exists in database
+        existing = self.existing_data.get(article_id)
+        if existing:
+            if existing[0] == summary_hash(entry_summary):
                 print(
-                    f"[Scraper] Finished with page {self.current_page - 1} in {article_end_timer - article_start_timer} seconds, moving on..."
+                    f"[Scraper] {article_id} already exists in DB with the same summary\n{'-' * 50}"
                 )
+                metrics.count("articles_unchanged")
+                return None
             else:
-                print(f"[{response.status_code}] Could not reach website {url}")
-
-        scraper_end_timer = perf_counter()
-        print(
-            f"[Scraper] Finished {self.total_pages} pages scraping in {scraper_end_timer - scraper_start_timer} seconds"
-        )
+                update_entry = True
+                metrics.count("articles_updated")
+                print(
+                    f"[Scraper] {article_id} needs to be updated in DB (last updated {existing[1]})\n[Update] New: {entry_summary}"
+                )
 
-        if len(self.scraped_data) >= 1:
-            self.dump_to_file(
-                self.scraped_data,
-                f"{logs_path}/logs/data/scraped_data_{self.year}_full.json",
-            )
-        return self.scraped_data
+        month, year = fields["month_year"].split()
+        article_date = date(int(year), int(bulgarian_months[month]), int(fields["day"]))
 
-    def article_looper(self, articles) -> tuple[dict, int]:
-        print(
-            f"[Looper] Got {len(self.scraped_data)} scraped data ({self.current_page})."
+        # The rule-based parser takes over when the RegEx results look incomplete, GPT only after it
+        formatted_place, formatted_period, method = resolve_notice(
+            entry_summary, article_date.strftime("%d.%m.%Y")
         )
-        for article in articles:
-            article_start = perf_counter()
-            ai_extract = False
-            update_entry = False
-
-            # Extract the id attribute
-            article_id: str = str(article.get("id", "N/A"))
-
-            # Extract entry-summary
-            entry_summary: str = str(
-                article.find("div", class_="entry-summary").text.strip()
-                if article.find("div", class_="entry-summary")
-                else "N/A"
-            )
-
-            # Continue with next loop if current article already exists in database
-            if isinstance(existing_data, dict) and existing_data.get(article_id):
-                if existing_data.get(article_id)["summary"] == entry_summary:
-                    print(
-                        f"[Scraper] {article_id} already exists in DB with the same summary\n{'-' * 50}"
-                    )
-                    continue
-                else:
-                    update_entry = True
-                    print(
-                        f"[Scraper] {article_id} needs to be updated in DB\n[Update] Old: {existing_data.get(article_id)['summary']}\n[Update] New: {entry_summary}"
-                    )
-
-            # Extract ht-day and ht-month-year
-            ht_day: str = str(
-                article.find("span", class_="ht-day").text.strip()
-                if article.find("span", class_="ht-day")
-                else "N/A"
-            )
-            ht_month_year: str = str(
-                article.find("span", class_="ht-month-year").text.strip()
-                if article.find("span", class_="ht-month-year")
-                else "N/A"
-            )
-
-            # Extract author name
-            author: str = str(
-                article.find("span", class_="author vcard").text.strip()
-                if article.find("span", class_="author vcard")
-                else "N/A"
-            )
-
-            # Extract entry-title
-            entry_title: str = str(
-                article.find("h2", class_="entry-title").text.strip()
-                if article.find("h2", class_="entry-title")
-                else "N/A"
-            )
-
-            # Extract category name under fa fa-bookmark
-            category: str = str(
-                article.find("div", class_="entry-categories").find("a").text.strip()
-                if article.find("div", class_="entry-categories")
-                else "N/A"
-            )
-
-            # Extract comments
-            comments: str = str(
-                article.find("a", href=True, class_=None).text.strip()
-                if article.find("i", class_="fa fa-comment-o")
-                else "No Comments"
-            )
-
-            # Format the data
-            formatted_date = f"{ht_day}.{bulgarian_months[ht_month_year.split()[0]]}.{ht_month_year.split()[1]}"  # Format to a datetime format - dd.MM.YYYY
-            formatted_place = (
-                re.search(self.place_pattern, entry_summary)
-                .group(0)[0:]
-                .replace("гр. ", "гр.")
-                .replace("с. ", "с.")
-                .replace("гр.", "гр. ")
-                .replace("с.", "с. ")
-                .replace("град ", "гр. ")
-                .replace("село ", "с. ")
-                if re.search(self.place_pattern, entry_summary)
-                else None
-            )
-            formatted_period = f"{entry_summary.split('периода от ')[1].strip()[:5].replace(',', ':').replace('.',':').strip() if 'периода от ' in entry_summary else 'N/A'} - {entry_summary.split(' до ')[1].strip()[:5].replace(',', ':').replace('.',':').strip() if ' до ' in entry_summary else 'N/A'}"  # Try and avoid using RegEx for extracting period
-
-            # Call GPT
-            if (
-                "N/A" in formatted_period
-                or re.search(self.period_pattern_check, formatted_period) == None
-                or formatted_place == None
-                or len(formatted_place.split()) > 2
-            ):
-                gpt_extractor = OpenAIExtractor()
-                if gpt_extractor.valid_key:
-                    gpt_response = json.loads(
-                        gpt_extractor.extract_data(
-                            entry_summary, formatted_date.strip()
-                        )
-                    )
-                    ai_extract = True
-                    print(
-                        f"[GPT] Place Old: {formatted_place} | New: {gpt_response['places']}"
-                    )
-                    print(
-                        f"[GPT] Period Old: {formatted_period} | New: {gpt_response['period']}"
-                    )
-                    formatted_place = ", ".join(gpt_response["places"])
-                    formatted_period = gpt_response["period"]
-
-                    self.dump_to_file(
-                        gpt_response,
-                        f"{logs_path}/logs/gpt/{article_id}_{gpt_extractor.model}.json",
-                    )
-
-            self.scraped_data[article_id] = {
-                "day": ht_day.strip(),
-                "month_year": ht_month_year.strip(),
-                "date": formatted_date.strip(),
-                "place": formatted_place.strip(),
-                "period": formatted_period.strip(),
-                "author": author.strip(),
-                "title": entry_title.strip(),
-                "category": category.strip(),
-                "summary": entry_summary,
-                "current_page": self.current_page,
-                "total_pages": self.total_pages,
-                "comments": comments,
-                "ai_extract": ai_extract,
-                "gpt_data": gpt_response if ai_extract else None,
-                "update_entry": update_entry,
-            }
-            article_end = perf_counter()
-            print(
-                f"[Scraper] Finished with {article_id} in {article_end - article_start} seconds\n{'-' * 50}"
-            )
+        needs_gpt = method == "gpt"
+        self.extract_stats["articles"] += 1
+        self.extract_stats[method] += 1
+        if method == "rules":
+            print(f"[Rules] {article_id} Place: {formatted_place} | Period: {formatted_period}")
+            metrics.count("extract_rules")
+        elif method == "gpt":
+            metrics.count("gpt_fallbacks")
         else:
-            self.current_page += 1
-
-        print(f"[Looper] Outputting {len(self.scraped_data)} scraped data.")
-        return self.scraped_data
-
-    def dump_to_file(self, new_dump: dict, file_name: str):
-        """Appends data to a JSON or creates a new one. Writes all other logs in a new file"""
-        print(f"[File Dumper] Dumping {len(new_dump)} entries to {file_name}")
-
-        if "json" in file_name:
-            # Check if the file exists
-            if os.path.exists(file_name):
-                # Read the existing content
-                with open(file_name, "r", encoding="utf-8") as f:
-                    try:
-                        data = json.load(f)
-                    except json.JSONDecodeError:
-                        data = {}  # Empty file case
-            else:
-                data = {}
-
-            # Update the JSON object with new data
-            data.update(new_dump)
+            metrics.count("extract_regex")
+
+        entry = Article(
+            post_id=article_id,
+            title=fields["title"].strip(),
+            location=formatted_place,
+            period=formatted_period,
+            author=fields["author"].strip(),
+            summary=entry_summary,
+            category=fields["category"].strip(),
+            article_date=article_date,
+            page=self.current_page,
+            total_pages=self.total_pages,
+            comments=fields["comments"],
+            update_entry=update_entry,
+        )
 
-            # Write the updated data back to the file
-            with open(file_name, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
-        else:
-            # Write the data to the file
-            with open(file_name, "w", encoding="utf-8") as f:
-                f.write(str(new_dump))
-
-        print(f"[File Dumper] Data has been dumped to {file_name}")
-
-
-def input_to_db(data: dict):
-    db = Database()
-    x = OpenAIExtractor()
-
-    db_start = perf_counter()
-    for key, item in data.items():
-        insert_query = f"""
-        INSERT IGNORE INTO vik_{x.model.replace("-", "_")} (`post_id`, `title`, `location`, `period`, `author`, `summary`, `category`, `ai_extract`, `page`, `total_pages`, `comments`, `article_date` ) 
-        VALUES 
-        ('{key}', '{item["title"]}', '{item["place"]}', '{item["period"]}', '{item["author"]}', '{item["summary"]}', '{item["category"]}', '{1 if item["ai_extract"] else 0}', '{item["current_page"]}', '{item["total_pages"]}', '{item["comments"]}', '{datetime.strptime(item["date"], "%d.%m.%Y").strftime("%Y-%m-%d")}');"""
-
-        update_query = f"""
-        UPDATE vik_{x.model.replace("-", "_")} 
-        SET 
-        `title` = '{item["title"]}', `location` = '{item["place"]}', `period` = '{item["period"]}', `author` = '{item["author"]}', `summary` = '{item["summary"]}', `category` = '{item["category"]}', 
-        `ai_extract` = '{1 if item["ai_extract"] else 0}', `page` = '{item["current_page"]}', `total_pages` = '{item["total_pages"]}', `comments` = '{item["comments"]}', `article_date` = '{datetime.strptime(item["date"], "%d.%m.%Y").strftime("%Y-%m-%d")}' 
-        WHERE `post_id` = '{key}';
-        """
+        return entry, needs_gpt
 
-        if item["update_entry"]:
-            # Move the existing entry to the edited table
-            moved = db.move_data(key, existing_data.get(key), x.model)
-            print(
-                f"[DB] Could not move entry {key} to edited table"
-                if moved == False
-                else f"[DB] Moved entry {key} to edited table"
-            )
-
-            # Update the entry in the main table
-            execution = db.execute_query(update_query)
-            # print(f"[DB] Updating entry for '{key}'\n{update_query}")
-        else:
-            execution = db.execute_query(insert_query)
+    def start_gpt(self, entry: Article) -> Future | None:
+        """Fills the entry from the GPT cache, leaves it for the Batch API or starts an extraction in the pool.
+        Only the last case returns a future, `finish_gpt` applies its result"""
+        gpt_response = self.gpt_cache.get(
+            self.gpt.model, prompt_version, entry.summary, entry.date_text
+        )
 
-        if not execution:
-            print(
-                f"[DB] Could NOT add '{key}'\n{insert_query if item['update_entry'] == False else update_query}"
-            )
+        if gpt_response is not None:
+            self.apply_gpt(entry, gpt_response)
+        elif self.gpt_mode == "batch":
+            # Stored with the RegEx values for now, `batch.run_batch` updates them later. Writing the batch file
+            # needs no key, so a replay without one still counts what would need GPT
+            self.gpt_batch[entry.post_id] = (entry.summary, entry.date_text)
+            metrics.count("gpt_batched")
+        elif self.gpt.valid_key:
+            if self.gpt_pool is None:
+                self.gpt_pool = ExtractionPool(self.gpt)
+
+            return self.gpt_pool.submit(entry.summary, entry.date_text)
+
+        return None
+
+    def finish_gpt(self, entry: Article, future: Future) -> bool:
+        """Waits for an extraction started by `start_gpt`, failed ones keep the RegEx values and are retried by a resumed export"""
+        try:
+            gpt_response = future.result()
+        except Exception as err:
+            print(f"[GPT] Could not extract {entry.post_id}: {err}")
+            self.gpt_failed[entry.post_id] = (entry.summary, entry.date_text)
+
+            return False
+
+        self.gpt_cache.put(
+            self.gpt.model, prompt_version, entry.summary, entry.date_text, gpt_response
+        )
+        self.apply_gpt(entry, gpt_response)
+
+        return True
+
+    def retry_gpt(self, failed: dict, table: str) -> list:
+        """Extracts the `post_id -> (summary, date)` that failed in an earlier run again and writes the ones
+        that work now to the DB. Returns their post IDs"""
+        if not failed or not self.gpt.valid_key or self.gpt_mode == "batch":
+            return []
+
+        from batch import write_extractions
+        from db import Database
+
+        if self.gpt_pool is None:
+            self.gpt_pool = ExtractionPool(self.gpt)
+        futures = {
+            post_id: (summary, date_text, self.gpt_pool.submit(summary, date_text))
+            for post_id, (summary, date_text) in failed.items()
+        }
+
+        results, article_dates = {}, {}
+        for post_id, (summary, date_text, future) in futures.items():
+            try:
+                results[post_id] = future.result()
+            except Exception as err:
+                print(f"[GPT] Could not extract {post_id} again: {err}")
+                continue
+
+            self.gpt_cache.put(self.gpt.model, prompt_version, summary, date_text, results[post_id])
+            article_dates[post_id] = datetime.strptime(date_text, "%d.%m.%Y").date()
+        self.close_gpt_pool()
+
+        if results:
+            with Database() as db:
+                written = write_extractions(db, table, results, article_dates)
+            print(f"[GPT] Wrote {written} of {len(failed)} extractions that failed before")
+
+        return list(results)
+
+    def apply_gpt(self, entry: Article, gpt_response: dict):
+        """Replaces the RegEx place and period of a scraped entry with the GPT ones"""
+        print(f"[GPT] {entry.post_id} Place Old: {entry.location} | New: {gpt_response['places']}")
+        print(f"[GPT] {entry.post_id} Period Old: {entry.period} | New: {gpt_response['period']}")
+
+        entry.set_extraction(canonical_location(gpt_response["places"]), gpt_response["period"].strip())
+        entry.ai_extract = True
+        entry.gpt_data = gpt_response
+
+        # The GPT response goes to the same stream as the entries
+        self.writer.write(self.year, "gpt", entry.post_id, {"model": self.gpt.model, **gpt_response})
+
+    def close_gpt_pool(self):
+        if self.gpt_pool is not None:
+            self.gpt_pool.close()
+            self.gpt_pool.print_stats()
+            self.gpt_pool = None
+
+    def print_extract_stats(self):
+        articles = self.extract_stats["articles"]
+        without_gpt = articles - self.extract_stats["gpt"]
+        print(
+            f"[Rules] {without_gpt} of {articles} articles ({without_gpt / max(1, articles):.1%}) resolved without GPT "
+            f"(RegEx: {self.extract_stats['regex']}, rules: {self.extract_stats['rules']}, GPT: {self.extract_stats['gpt']})"
+        )
 
-    db.close_connection()
-    db_end = perf_counter()
-    print(f"[DB] Finished with {len(data)} entries in {db_end - db_start} seconds")
 
+def incremental(year: int | None = None):
+    """Scrapes the new and changed entries of the year, the current one by default, straight into the DB"""
+    from db import Database
 
-if __name__ == "__main__":
     start_total = perf_counter()
+    year = year or datetime.now().year
 
-    year = datetime.now().year
-
-    # Initiate to get the model name which is used for table names
-    gpt = OpenAIExtractor()
+    # Tables are named after the GPT model
+    table = table_name(model)
 
-    # Load the data we will use for checking existing entries
-    db = Database()
-    get_query = f"SELECT * FROM vik_{gpt.model.replace('-', '_')} WHERE `article_date` LIKE '{year}%';"
-    existing_data = db.get_data(get_query)
-    db.close_connection()
+    # Load the hashes we will use for checking existing entries
+    with Database() as db:
+        existing_data = db.get_index(table, year)
 
     if existing_data is not False:
         print(f"[Main] {len(existing_data)} entries loaded")
 
-    # Start the scraping process
-    x = Scraper(year=year, pages=2)
+    # Start the scraping process, the pages are followed until one has nothing new so no post is missed
+    x = Scraper(year=year, pages=0, existing_data=existing_data or {}, manifest=year_manifest(year))
 
+    # Stream the pages into the DB as they are scraped
     if x.total_pages > 0:
-        scraped = x.web_scraper()
+        pipeline = Pipeline(x, table)
+        pipeline.run()
+        if pipeline.completed:
+            x.fetcher.save_validators()
     else:
-        print(f"[Main] Got no pages")
-
-    if len(scraped) >= 1:
-        input_to_db(scraped)
+        print("[Main] Got no pages")
 
     end_total = perf_counter()
     print(f"[Main] Finished the process in {end_total - start_total} seconds")
+    metrics.print_stats()
+    metrics.flush("incremental", year=year, seconds=end_total - start_total)
+
+
+def replay(years: list | range | None = None, write_db: bool = False):
+    """Runs the pages saved in the page cache through the pipeline without touching the site.
+    Without `write_db` nothing goes to the DB or to GPT, the entries only go to the JSON Lines files
+    and the ones that would need GPT are counted. The files are `replay_data_{year}.jsonl`, the dumps of the real runs
+    are left alone"""
+    start_total = perf_counter()
+    years = list(years) if years is not None else [datetime.now().year]
+    table = table_name(model)
+    cache = page_cache(replay=True)
+
+    for year in years:
+        existing_data = {}
+        if write_db:
+            from db import Database
+
+            with Database() as db:
+                existing_data = db.get_index(table, year) or {}
+
+        x = Scraper(
+            year=year,
+            pages=0,
+            cache=cache,
+            existing_data=existing_data,
+            stop_early=False,
+            gpt_mode="sync" if write_db else "batch",
+        )
+        if x.total_pages <= 0:
+            print(f"[Main] {year} is not in the page cache")
+            continue
+        x.writer = JsonlWriter(f"{logs_path}/logs/data", prefix="replay_data")
+
+        Pipeline(x, table, database=None if write_db else NullDatabase).run()
+        if x.gpt_batch:
+            print(f"[Main] {len(x.gpt_batch)} entries of {year} would need GPT")
+
+    print(f"[Main] Finished the replay in {perf_counter() - start_total} seconds")
+    metrics.print_stats()
+    metrics.flush("replay", years=years, seconds=perf_counter() - start_total)
+
+
+if __name__ == "__main__":
+    incremental()
@@ -0,0 +1,133 @@
+"""Append-only JSON Lines output of the scraper.
+Every line is `{"type": "article" | "gpt", "id": post_id, "year": ..., "data": {...}}`, one file per year.
+Later lines win, `python stream.py compact <file>` keeps only the last one per type and id
+and `python stream.py merge <output> <file> ...` joins several files the same way"""
+
+import json, os, sys, threading
+from time import monotonic
+from atomic import atomic_write
+
+
+class JsonlWriter:
+    """### Appends records to `{prefix}_{year}.jsonl` files and fsyncs them periodically"""
+
+    def __init__(
+        self,
+        path: str,
+        prefix: str = "scraped_data",
+        fsync_every: int = 100,
+        fsync_interval: float = 5.0,
+    ):
+        self.path: str = path
+        self.prefix: str = prefix
+        self.fsync_every: int = fsync_every  # Records between two fsyncs
+        self.fsync_interval: float = fsync_interval  # Seconds between two fsyncs
+
+        self.lock = threading.Lock()
+        self.files: dict = {}  # year -> open file
+        self.unsynced: int = 0
+        self.synced_at: float = monotonic()
+        self.written: int = 0
+
+        os.makedirs(path, exist_ok=True)
+
+    def file_name(self, year: int) -> str:
+        return os.path.join(self.path, f"{self.prefix}_{year}.jsonl")
+
+    def write(self, year: int, record_type: str, record_id: str, data: dict):
+        line = json.dumps(
+            {"type": record_type, "id": record_id, "year": year, "data": data},
+            ensure_ascii=False,
+            default=str,
+        )
+
+        with self.lock:
+            f = self.files.get(year)
+            if f is None:
+                f = self.files[year] = open(self.file_name(year), "a", encoding="utf-8")
+
+            f.write(line + "\n")
+            self.written += 1
+            self.unsynced += 1
+
+            if (
+                self.unsynced >= self.fsync_every
+                or monotonic() - self.synced_at >= self.fsync_interval
+            ):
+                self.sync()
+
+    def sync(self):
+        for f in self.files.values():
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.unsynced = 0
+        self.synced_at = monotonic()
+
+    def close(self):
+        with self.lock:
+            self.sync()
+            for f in self.files.values():
+                f.close()
+            self.files = {}
+
+        print(f"[File Dumper] Appended {self.written} records to {self.path}")
+
+
+def read_records(file_name: str):
+    """Yields the records of a JSON Lines file, a torn last line from a crash is skipped"""
+    with open(file_name, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"[File Dumper] Skipping a broken line in {file_name}")
+
+
+def read_dump(file_name: str):
+    """Yields the records of a JSON Lines file or of an older `scraped_data_{year}_full.json` dump.
+    Those hold one object of `post_id -> article` in the format `Article.from_dict` also reads"""
+    if not file_name.endswith(".json"):
+        yield from read_records(file_name)
+        return
+
+    with open(file_name, "r", encoding="utf-8") as f:
+        try:
+            articles = json.load(f)
+        except json.JSONDecodeError:
+            print(f"[File Dumper] {file_name} is broken, skipping it")
+            return
+
+    for post_id, data in articles.items():
+        # "dd.mm.YYYY", the listing of a year only has the articles of that year
+        year = int(data["date"][-4:]) if data.get("date") else None
+        yield {"type": "article", "id": post_id, "year": year, "data": data}
+
+
+def merge(file_names: list, output: str) -> int:
+    """Writes the last record per type and id of all `file_names` to `output`. Returns how many were kept"""
+    latest: dict = {}
+    for file_name in file_names:
+        for record in read_records(file_name):
+            key = (record["type"], record["id"])
+            latest.pop(key, None)  # Re-insert so the order follows the last write
+            latest[key] = record
+
+    atomic_write(output, "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in latest.values()))
+
+    return len(latest)
+
+
+def compact(file_name: str) -> int:
+    return merge([file_name], file_name)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "compact":
+        for file_name in sys.argv[2:]:
+            print(f"[File Dumper] {file_name} compacted to {compact(file_name)} records")
+    elif len(sys.argv) >= 4 and sys.argv[1] == "merge":
+        print(f"[File Dumper] Merged {merge(sys.argv[3:], sys.argv[2])} records into {sys.argv[2]}")
+    else:
+        print("Usage: python stream.py compact <file> ... | python stream.py merge <output> <file> ...")
+        sys.exit(1)
@@ -0,0 +1,39 @@
+import pytest
+from gazetteer import canonical_location, place_id
+
+
+@pytest.mark.parametrize(
+    "places, location",
+    [
+        ("с.КОВАЧЕВО, гр.Пазарджик", "с. Ковачево, гр. Пазарджик"),
+        (["с.КОВАЧЕВО", "гр. Пазарджик"], "с. Ковачево, гр. Пазарджик"),
+        ("село Ковачево", "с. Ковачево"),
+        ("с. Ковачево, с.Ковачево", "с. Ковачево"),
+        ("с. „Дъбравите“", "с. Дъбравите"),
+        # A Latin "a" that slipped into the name
+        ("с.Ковaчево", "с. Ковачево"),
+        # Misspelled, matched through the trigrams
+        ("с. Мало Канаре", "с. Мало Конаре"),
+        ("с. Малко Белово", "с. Малко Белово"),
+        ("с. Голямо Белово", "с. Голямо Белово"),
+        ("Белово", "гр. Белово"),
+        # Unknown places keep their name
+        ("с. НЕПОЗНАТО", "с. Непознато"),
+        ("", None),
+        (None, None),
+    ],
+)
+def test_canonical_location(places, location):
+    assert canonical_location(places) == location
+
+
+@pytest.mark.parametrize(
+    "place, settlement_id",
+    [
+        ("с. Дъбравите", 69),
+        ("с. Малко Белово", 112),
+        ("с. Непознато", None),
+    ],
+)
+def test_place_id(place, settlement_id):
+    assert place_id(place) == settlement_id
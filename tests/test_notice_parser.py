@@ -0,0 +1,74 @@
+import pytest
+from notice_parser import parse_notice
+
+
+article_date = "01.09.2024"
+
+
+@pytest.mark.parametrize(
+    "summary, places, period, complete",
+    [
+        # Plain times
+        (
+            "Поради авария на уличен водопровод, е прекъснато водоподаването в с. Дъбравите в периода от 09,00 до 12,00 часа.",
+            ["с. Дъбравите"],
+            "09:00 - 12:00",
+            True,
+        ),
+        # Overnight, the end is before the start
+        (
+            "Поради авария е прекъснато водоподаването в с.КОВАЧЕВО от 22:00 до 06:00 часа.",
+            ["с. Ковачево"],
+            "22:00 - 06:00",
+            True,
+        ),
+        # The start is on the article date, only the end date goes in brackets
+        (
+            "Поради авария ще бъде прекъснато водоподаването в гр. Пазарджик от 10:00 ч. на 01.09.2024 г. до 16:00 ч. на 02.09.2024 г.",
+            ["гр. Пазарджик"],
+            "10:00 - 16:00 (02.09.2024)",
+            True,
+        ),
+        # Both dates differ from the article date
+        (
+            "Поради ремонт ще бъде спряно водоподаването в с. Мокрище от 08:00 ч. на 03.09.2024 г. до 17:00 ч. на 04.09.2024 г.",
+            ["с. Мокрище"],
+            "08:00 - 17:00 (03.09.2024 - 04.09.2024)",
+            True,
+        ),
+        # Open start
+        (
+            "Поради авария е спряно водоподаването в с. Огняново до 17,00 часа.",
+            ["с. Огняново"],
+            "- 17:00",
+            True,
+        ),
+        # Open end
+        (
+            "Поради авария е спряно водоподаването в с. Огняново от 10 часа.",
+            ["с. Огняново"],
+            "10:00 -",
+            True,
+        ),
+        # No times, GPT has to look at it
+        (
+            "Поради авария е спряно водоподаването на селата Гелеменово и Сбор.",
+            ["с. Гелеменово", "с. Сбор"],
+            "не е указан",
+            False,
+        ),
+        # Streets without a town are in Pazardzhik
+        (
+            "Поради авария е спряно водоподаването на ул. Болнична от 09:00 до 13:00 часа.",
+            ["гр. Пазарджик"],
+            "09:00 - 13:00",
+            True,
+        ),
+    ],
+)
+def test_parse_notice(summary, places, period, complete):
+    data, is_complete = parse_notice(summary, article_date)
+
+    assert data["places"] == places
+    assert data["period"] == period
+    assert is_complete is complete
@@ -0,0 +1,32 @@
+from datetime import date, datetime
+import pytest
+from period import parse_period
+
+
+article_date = date(2024, 9, 1)
+
+
+@pytest.mark.parametrize(
+    "period, start, end",
+    [
+        # The forms of the GPT prompt in ai.py
+        ("09:00 - 12:00", datetime(2024, 9, 1, 9), datetime(2024, 9, 1, 12)),
+        ("09:00 - 12:00 (02.09.2024)", datetime(2024, 9, 1, 9), datetime(2024, 9, 2, 12)),
+        ("- 17:00", None, datetime(2024, 9, 1, 17)),
+        ("10:00 -", datetime(2024, 9, 1, 10), None),
+        ("не е указан", None, None),
+        # Overnight, the water comes back the next day
+        ("22:00 - 06:00", datetime(2024, 9, 1, 22), datetime(2024, 9, 2, 6)),
+        # Two dates are the start and the end
+        ("08:00 - 17:00 (03.09.2024 - 04.09.2024)", datetime(2024, 9, 3, 8), datetime(2024, 9, 4, 17)),
+        ("- 17:00 (03.09.2024)", None, datetime(2024, 9, 3, 17)),
+        ("10:00 - 24:00", datetime(2024, 9, 1, 10), datetime(2024, 9, 2)),
+        ("09.30 - 14,30", datetime(2024, 9, 1, 9, 30), datetime(2024, 9, 1, 14, 30)),
+        # An end before the start with explicit dates is a typo, only the start is kept
+        ("12:00 - 09:00 (01.09.2024 - 01.09.2024)", datetime(2024, 9, 1, 12), None),
+        ("", None, None),
+        (None, None, None),
+    ],
+)
+def test_parse_period(period, start, end):
+    assert parse_period(period, article_date) == (start, end)